@@ -2,9 +2,10 @@
 Endpoint 5 & 6: PTP Document Generation and Download
 Generates Excel and Word PTP matching industry standards
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from fastapi.responses import FileResponse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -25,6 +26,8 @@ from app.models.api_models import (
     JobStatusResponse
 )
 from app.config import settings
+from app.core.job_store import wait_for_job
+from app.core.responses import FastJSONResponse
 from loguru import logger
 
 router = APIRouter()
@@ -439,16 +442,19 @@ async def process_dvp_generation(job_id: str, request: DVPGenerationRequest):
 
         generator = PTPGenerator()
         
+        # Document generation is CPU-bound, so it runs on a worker thread
         output_format = request.output_format.lower()
         if output_format == 'docx' or output_format == 'doc':
-             output_path = generator.generate_ptp_docx(
+             output_path = await asyncio.to_thread(
+                generator.generate_ptp_docx,
                 component_profile=request.component_profile.model_dump(),
                 test_cases=request.test_cases,
                 include_traceability=request.include_traceability_sheet
             )
         else:
             # Default to xlsx
-            output_path = generator.generate_ptp(
+            output_path = await asyncio.to_thread(
+                generator.generate_ptp,
                 component_profile=request.component_profile.model_dump(),
                 test_cases=request.test_cases,
                 include_traceability=request.include_traceability_sheet
@@ -568,15 +574,23 @@ async def generate_dvp_document(
     )
 
 @router.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_dvp_generation_status(job_id: str):
+async def get_dvp_generation_status(
+    job_id: str,
+    wait: float = Query(0.0, ge=0.0, le=60.0, description="Seconds to wait for the job to finish"),
+    since_status: Optional[str] = Query(None, description="Return early once the status differs from this")
+):
     """
     **Check PTP generation job status**
+
+    **Parameters:**
+    - job_id: Job ID from /generate endpoint
+    - wait: Seconds to hold the request until the job finishes (long polling)
+    - since_status: With wait, also return as soon as the status differs from this
     """
-    if job_id not in dvp_jobs:
+    job = await wait_for_job(dvp_jobs, job_id, wait, since_status)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-    job = dvp_jobs[job_id]
-
     return JobStatusResponse(
         job_id=job_id,
         status=job['status'],
@@ -609,7 +623,7 @@ async def download_dvp(dvp_id: str):
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document" if str(file_path).endswith('.docx') else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
-@router.get("/list")
+@router.get("/list", response_class=FastJSONResponse)
 async def list_generated_dvps():
     """
     **List all generated PTPs**
@@ -629,7 +643,7 @@ async def list_generated_dvps():
         ]
     }
 
-@router.delete("/delete/{dvp_id}")
+@router.delete("/delete/{dvp_id}", response_class=FastJSONResponse)
 async def delete_dvp(dvp_id: str):
     """
     **Delete a generated PTP**
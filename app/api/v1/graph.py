@@ -2,9 +2,10 @@
 Endpoint 2: Knowledge Graph Construction
 Builds multi-layer knowledge graph from ingested documents
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from pydantic import BaseModel, Field
 from typing import Optional
+import asyncio
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -17,17 +18,55 @@ from app.models.api_models import (
 from app.config import settings
 from app.core.graph_builder import KnowledgeGraphBuilder
 from app.core.semantic_search import SemanticSearchEngine
+from app.core.job_store import JobStore, wait_for_job
+from app.core.responses import FastJSONResponse
+from app.api.v1.retrieval import clear_result_cache
 from loguru import logger
 
 router = APIRouter()
 
-# In-memory job storage
-graph_jobs = {}
+# Job storage (Redis-backed when settings.redis_url is set)
+graph_jobs = JobStore("graph_jobs")
 
 # Global graph builder and search engine
 graph_builder = None
 search_engine = None
 
+# Search engines keyed by (embedding model, backend, vector DB path), so the
+# model weights and vector DB client are loaded once per process
+_engine_cache = {}
+
+def get_search_engine() -> SemanticSearchEngine:
+    """
+    Get the shared search engine for the configured model and vector DB
+    """
+    key = (
+        settings.embedding_model,
+        settings.embedding_backend,
+        settings.embedding_model_file,
+        settings.vector_db_path
+    )
+    if key not in _engine_cache:
+        _engine_cache[key] = SemanticSearchEngine(
+            model_name=settings.embedding_model,
+            vector_db_path=settings.vector_db_path,
+            seed=42,
+            embedding_cache_path=settings.embedding_cache_path,
+            backend=settings.embedding_backend,
+            model_file=settings.embedding_model_file,
+            pool_workers=settings.embedding_pool_workers,
+            num_threads=settings.embedding_num_threads,
+            compile_model=settings.embedding_compile
+        )
+    return _engine_cache[key]
+
+def close_search_engines():
+    """
+    Release resources held by the cached search engines (e.g. encode workers)
+    """
+    for engine in _engine_cache.values():
+        engine.close()
+
 class GraphBuildRequest(BaseModel):
     """Request to build knowledge graph"""
     ingestion_job_id: str = Field(..., description="Job ID from ingestion")
@@ -43,19 +82,22 @@ async def process_graph_building(job_id: str, request: GraphBuildRequest):
     global graph_builder, search_engine
 
     try:
-        graph_jobs[job_id]['status'] = JobStatus.PROCESSING
-        graph_jobs[job_id]['current_step'] = 'Initializing graph builder'
-        graph_jobs[job_id]['progress_percent'] = 10.0
+        await graph_jobs.update(
+            job_id,
+            status=JobStatus.PROCESSING,
+            current_step='Initializing graph builder',
+            progress_percent=10.0
+        )
 
         # Initialize graph builder
-        graph_builder = KnowledgeGraphBuilder(seed=42)
+        builder = KnowledgeGraphBuilder(seed=42)
 
         # Determine data path
         # Try to use ingestion temp path first, fallback to default data dir
         from app.api.v1.ingest import ingestion_jobs
 
-        if request.ingestion_job_id in ingestion_jobs:
-            ingest_job = ingestion_jobs[request.ingestion_job_id]
+        ingest_job = await ingestion_jobs.get(request.ingestion_job_id)
+        if ingest_job is not None:
             data_path = ingest_job.get('temp_path', settings.data_dir)
         else:
             data_path = settings.data_dir
@@ -63,57 +105,60 @@ async def process_graph_building(job_id: str, request: GraphBuildRequest):
         logger.info(f"Building graph from: {data_path}")
 
         # Phase 1: Build graph structure
-        graph_jobs[job_id]['current_step'] = 'Building graph structure'
-        graph_jobs[job_id]['progress_percent'] = 20.0
+        await graph_jobs.update(job_id, current_step='Building graph structure', progress_percent=20.0)
 
-        result = graph_builder.build_from_directory(
+        # CPU-bound phases run on a worker thread so the event loop keeps
+        # serving status polls and other requests
+        result = await asyncio.to_thread(
+            builder.build_from_directory,
             data_path=data_path,
             enable_structural=request.enable_structural_links,
             enable_reference=request.enable_reference_links
         )
+        await asyncio.to_thread(builder.get_keyword_index)
+        graph_builder = builder
+        clear_result_cache()
 
-        graph_jobs[job_id]['progress_percent'] = 60.0
+        await graph_jobs.update(job_id, progress_percent=60.0)
 
         # Phase 2: Build semantic index (if enabled)
         if request.enable_semantic_links:
-            graph_jobs[job_id]['current_step'] = 'Building semantic index'
-            graph_jobs[job_id]['progress_percent'] = 70.0
+            await graph_jobs.update(job_id, current_step='Building semantic index', progress_percent=70.0)
 
-            search_engine = SemanticSearchEngine(
-                model_name=settings.embedding_model,
-                vector_db_path=settings.vector_db_path,
-                seed=42
-            )
+            engine = await asyncio.to_thread(get_search_engine)
 
-            search_engine.index_graph(graph_builder.graph)
+            await asyncio.to_thread(engine.index_graph, builder.graph)
+            search_engine = engine
+            clear_result_cache()
 
-            graph_jobs[job_id]['progress_percent'] = 90.0
+            await graph_jobs.update(job_id, progress_percent=90.0)
 
-        # Save graph
-        graph_jobs[job_id]['current_step'] = 'Saving graph'
+        # Save graph (JSON export is generated on demand by /export/{job_id})
+        await graph_jobs.update(job_id, current_step='Saving graph')
         graph_path = Path(settings.graph_storage_path) / f"{job_id}.pkl"
-        graph_builder.save_graph(str(graph_path))
+        await asyncio.to_thread(builder.save_graph, str(graph_path))
 
-        # Also export as JSON
-        json_path = Path(settings.graph_storage_path) / f"{job_id}.json"
-        graph_builder.export_json(str(json_path))
+        # Save embeddings next to the graph so /load can restore the index
+        if request.enable_semantic_links:
+            await asyncio.to_thread(search_engine.save_vectors, str(graph_path.with_suffix('.npz')))
 
         # Update job status
-        graph_jobs[job_id]['status'] = JobStatus.COMPLETED
-        graph_jobs[job_id]['current_step'] = 'Completed'
-        graph_jobs[job_id]['progress_percent'] = 100.0
-        graph_jobs[job_id]['result'] = {
-            **result,
-            'graph_path': str(graph_path),
-            'json_path': str(json_path)
-        }
+        await graph_jobs.update(
+            job_id,
+            status=JobStatus.COMPLETED,
+            current_step='Completed',
+            progress_percent=100.0,
+            result={
+                **result,
+                'graph_path': str(graph_path)
+            }
+        )
 
         logger.info(f"Graph building job {job_id} completed successfully")
 
     except Exception as e:
         logger.exception(f"Graph building job {job_id} failed: {e}")
-        graph_jobs[job_id]['status'] = JobStatus.FAILED
-        graph_jobs[job_id]['error'] = str(e)
+        await graph_jobs.update(job_id, status=JobStatus.FAILED, error=str(e))
 
 # ==================== ENDPOINTS ====================
 
@@ -160,13 +205,14 @@ async def build_knowledge_graph(
     job_id = str(uuid.uuid4())
 
     # Create job entry
-    graph_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.PENDING,
-        'current_step': 'Initializing',
-        'progress_percent': 0.0,
-        'created_at': datetime.utcnow()
-    }
+    await graph_jobs.create(
+        job_id,
+        job_id=job_id,
+        status=JobStatus.PENDING,
+        current_step='Initializing',
+        progress_percent=0.0,
+        created_at=datetime.utcnow()
+    )
 
     # Start background processing
     background_tasks.add_task(
@@ -186,22 +232,27 @@ async def build_knowledge_graph(
     )
 
 @router.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_graph_status(job_id: str):
+async def get_graph_status(
+    job_id: str,
+    wait: float = Query(0.0, ge=0.0, le=60.0, description="Seconds to wait for the job to finish"),
+    since_status: Optional[str] = Query(None, description="Return early once the status differs from this")
+):
     """
     **Check graph building job status**
 
     **Parameters:**
     - job_id: Job ID from /build endpoint
+    - wait: Seconds to hold the request until the job finishes (long polling)
+    - since_status: With wait, also return as soon as the status differs from this
 
     **Returns:**
     - Current status and progress
     - Result when completed (nodes, edges, checksum)
     """
-    if job_id not in graph_jobs:
+    job = await wait_for_job(graph_jobs, job_id, wait, since_status)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-    job = graph_jobs[job_id]
-
     return JobStatusResponse(
         job_id=job_id,
         status=job['status'],
@@ -212,7 +263,7 @@ async def get_graph_status(job_id: str):
         error=job.get('error')
     )
 
-@router.get("/statistics")
+@router.get("/statistics", response_class=FastJSONResponse)
 async def get_graph_statistics():
     """
     **Get knowledge graph statistics**
@@ -237,7 +288,7 @@ async def get_graph_statistics():
 
     return {
         "statistics": stats,
-        "graph_checksum": graph_builder._compute_checksum(),
+        "graph_checksum": graph_builder.get_checksum(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -252,19 +303,26 @@ async def export_graph(job_id: str, format: str = "json"):
 
     **Returns:**
     - File download
+
+    **Note:** The JSON file is generated from the saved graph on first request
     """
-    if job_id not in graph_jobs:
+    job = await graph_jobs.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
-
-    job = graph_jobs[job_id]
     if job['status'] != JobStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Graph building not completed")
 
     result = job.get('result', {})
-    export_path = result.get('json_path', '')
+    graph_path = Path(result.get('graph_path', ''))
+    export_path = graph_path.with_suffix('.json')
 
-    if not export_path or not Path(export_path).exists():
-        raise HTTPException(status_code=404, detail="Export file not found")
+    if not export_path.exists():
+        if not graph_path.is_file():
+            raise HTTPException(status_code=404, detail="Graph file not found")
+
+        exporter = KnowledgeGraphBuilder()
+        await asyncio.to_thread(exporter.load_graph, str(graph_path))
+        await asyncio.to_thread(exporter.export_json, str(export_path))
 
     from fastapi.responses import FileResponse
     return FileResponse(
@@ -273,15 +331,16 @@ async def export_graph(job_id: str, format: str = "json"):
         media_type="application/json"
     )
 
-@router.get("/list")
+@router.get("/list", response_class=FastJSONResponse)
 async def list_graph_jobs():
     """
     **List all graph building jobs**
 
     Returns a list of all graph construction jobs with their status.
     """
+    jobs = await graph_jobs.items()
     return {
-        "total_jobs": len(graph_jobs),
+        "total_jobs": len(jobs),
         "jobs": [
             {
                 "job_id": job_id,
@@ -289,11 +348,11 @@ async def list_graph_jobs():
                 "progress_percent": job.get('progress_percent', 0.0),
                 "created_at": job['created_at'].isoformat()
             }
-            for job_id, job in graph_jobs.items()
+            for job_id, job in jobs
         ]
     }
 
-@router.post("/load/{job_id}")
+@router.post("/load/{job_id}", response_class=FastJSONResponse)
 async def load_existing_graph(job_id: str):
     """
     **Load a previously built graph**
@@ -315,15 +374,19 @@ async def load_existing_graph(job_id: str):
 
     try:
         # Load graph
-        graph_builder = KnowledgeGraphBuilder()
-        graph_builder.load_graph(str(graph_path))
-
-        # Load semantic search
-        search_engine = SemanticSearchEngine(
-            model_name=settings.embedding_model,
-            vector_db_path=settings.vector_db_path,
-            seed=42
-        )
+        builder = KnowledgeGraphBuilder()
+        await asyncio.to_thread(builder.load_graph, str(graph_path))
+        await asyncio.to_thread(builder.get_keyword_index)
+        graph_builder = builder
+
+        # Load semantic search (reuses the already loaded model if any)
+        search_engine = await asyncio.to_thread(get_search_engine)
+
+        # Restore the graph's semantic index from its saved embeddings
+        vectors_path = graph_path.with_suffix('.npz')
+        if vectors_path.exists():
+            await asyncio.to_thread(search_engine.load_vectors, builder.graph, str(vectors_path))
+        clear_result_cache()
 
         stats = graph_builder.get_statistics()
 
@@ -2,11 +2,15 @@
 Endpoint 1: Data Ingestion from External Sources
 Fetches standards documents from external API or local files
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Query
 from typing import List, Optional
+import asyncio
 import httpx
-import json
+import math
+import mmap
+import orjson
 import os
+import shutil
 from pathlib import Path
 import uuid
 from datetime import datetime
@@ -18,69 +22,178 @@ from app.models.api_models import (
     JobStatusResponse
 )
 from app.config import settings
+from app.core.job_store import JobStore, wait_for_job
+from app.core.responses import FastJSONResponse
 from loguru import logger
 
 router = APIRouter()
 
-# In-memory job storage (replace with Redis/DB in production)
-ingestion_jobs = {}
+# Job storage (Redis-backed when settings.redis_url is set)
+ingestion_jobs = JobStore("ingestion_jobs")
+
+# Maximum number of JSON files read or written concurrently during ingestion
+FILE_IO_CONCURRENCY = 32
+
+# Maximum concurrent connections when paging through the external API
+EXTERNAL_API_MAX_CONNECTIONS = 32
+
+# Buffer size when copying uploaded files to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
 
 # ==================== HELPER FUNCTIONS ====================
 
+def _extract_documents(data) -> List[dict]:
+    """
+    Pull the document list out of an external API response body
+    """
+    # Assume API returns list of documents
+    if isinstance(data, dict) and 'documents' in data:
+        return data['documents']
+    elif isinstance(data, list):
+        return data
+    else:
+        return [data]
+
+def _is_paginated(data, filters: dict, first_page_size: int) -> bool:
+    """
+    Check whether an external API response is the first of several pages
+    """
+    if not isinstance(data, dict) or 'page' in filters:
+        return False
+
+    total, page_size = data.get('total'), data.get('page_size')
+    if not all(isinstance(value, int) and not isinstance(value, bool) and value > 0
+               for value in (total, page_size)):
+        return False
+
+    # A first page that already holds every document needs no more requests
+    return first_page_size < total
+
 async def fetch_from_external_api(source_url: str, api_key: Optional[str], filters: dict) -> List[dict]:
     """
     Fetch standards documents from external API
+
+    If the first response reports `total` and `page_size` and holds only the
+    first page, the remaining pages are requested concurrently over the same
+    HTTP/2 connection pool. Any other response (e.g. a plain document list)
+    is used as is.
     """
     headers = {}
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    async with httpx.AsyncClient(
+        timeout=60.0,
+        http2=True,
+        headers=headers,
+        limits=httpx.Limits(max_connections=EXTERNAL_API_MAX_CONNECTIONS)
+    ) as client:
         try:
-            response = await client.get(
-                str(source_url),
-                headers=headers,
-                params=filters
-            )
+            response = await client.get(str(source_url), params=filters)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
+            documents = _extract_documents(data)
+
+            if not _is_paginated(data, filters, len(documents)):
+                return documents
+
+            page_count = math.ceil(data['total'] / data['page_size'])
+            if page_count > 1:
+                logger.info(f"Fetching {page_count - 1} more pages from external API")
+
+            async def fetch_page(page: int) -> List[dict]:
+                page_response = await client.get(str(source_url), params={**filters, 'page': page})
+                page_response.raise_for_status()
+                return _extract_documents(orjson.loads(page_response.content))
 
-            # Assume API returns list of documents
-            if isinstance(data, dict) and 'documents' in data:
-                return data['documents']
-            elif isinstance(data, list):
-                return data
-            else:
-                return [data]
+            pages = await asyncio.gather(*(fetch_page(page) for page in range(2, page_count + 1)))
+            for page_documents in pages:
+                documents.extend(page_documents)
+
+            return documents
 
         except httpx.HTTPError as e:
             logger.error(f"HTTP error fetching from external API: {e}")
             raise HTTPException(status_code=502, detail=f"External API error: {str(e)}")
 
-def load_from_local_directory(data_dir: str) -> List[dict]:
+def _scan_json_files(directory: str) -> List[str]:
+    """
+    Recursively list non-empty JSON files using os.scandir
+
+    Directory entries carry their stat info, so empty files are filtered out
+    without an extra syscall per file.
+    """
+    json_files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                json_files.extend(_scan_json_files(entry.path))
+            elif entry.name.endswith('.json') and entry.is_file():
+                if entry.stat().st_size > 0:
+                    json_files.append(entry.path)
+                else:
+                    logger.warning(f"Skipping empty file: {entry.path}")
+    return json_files
+
+def _read_json_file(json_file: str) -> dict:
+    """
+    Read and parse a single JSON document (runs on a worker thread)
+    """
+    with open(json_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                data = orjson.loads(view)
+    data['_source_file'] = json_file
+    return data
+
+def _write_json_file(file_path: Path, doc: dict):
+    """
+    Serialize a document and write it to disk (runs on a worker thread)
+    """
+    file_path.write_bytes(orjson.dumps(doc))
+
+def _save_upload(upload: UploadFile, file_path: Path):
+    """
+    Copy an uploaded file to disk in fixed-size chunks (runs on a worker thread)
+    """
+    upload.file.seek(0)
+    with open(file_path, 'wb') as f:
+        shutil.copyfileobj(upload.file, f, length=UPLOAD_CHUNK_SIZE)
+
+async def load_from_local_directory(data_dir: str) -> List[dict]:
     """
     Load JSON files from local data directory
+
+    Files are read and parsed concurrently on worker threads so the event
+    loop stays responsive during large ingestions.
     """
-    documents = []
     data_path = Path(data_dir)
 
     if not data_path.exists():
         raise HTTPException(status_code=404, detail=f"Data directory not found: {data_dir}")
 
     # Recursively find all JSON files
-    json_files = list(data_path.rglob("*.json"))
+    json_files = await asyncio.to_thread(_scan_json_files, str(data_path))
 
     logger.info(f"Found {len(json_files)} JSON files in {data_dir}")
 
-    for json_file in json_files:
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                data['_source_file'] = str(json_file)
-                documents.append(data)
-        except Exception as e:
-            logger.warning(f"Failed to load {json_file}: {e}")
+    semaphore = asyncio.Semaphore(FILE_IO_CONCURRENCY)
+
+    async def read_bounded(json_file: str) -> dict:
+        async with semaphore:
+            return await asyncio.to_thread(_read_json_file, json_file)
+
+    results = await asyncio.gather(
+        *(read_bounded(json_file) for json_file in json_files),
+        return_exceptions=True
+    )
+
+    documents = []
+    for json_file, result in zip(json_files, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to load {json_file}: {result}")
             continue
+        documents.append(result)
 
     return documents
 
@@ -90,12 +203,11 @@ async def process_ingestion_job(job_id: str, source_url: Optional[str], api_key:
     Background task to process ingestion
     """
     try:
-        ingestion_jobs[job_id]['status'] = JobStatus.PROCESSING
-        ingestion_jobs[job_id]['current_step'] = 'Fetching documents'
+        await ingestion_jobs.update(job_id, status=JobStatus.PROCESSING, current_step='Fetching documents')
 
         if use_local:
             # Load from local data directory
-            documents = load_from_local_directory(settings.data_dir)
+            documents = await load_from_local_directory(settings.data_dir)
         else:
             # Fetch from external API
             documents = await fetch_from_external_api(source_url, api_key, filters)
@@ -104,26 +216,35 @@ async def process_ingestion_job(job_id: str, source_url: Optional[str], api_key:
         temp_dir = Path(settings.temp_dir) / job_id
         temp_dir.mkdir(parents=True, exist_ok=True)
 
+        semaphore = asyncio.Semaphore(FILE_IO_CONCURRENCY)
+
+        async def write_bounded(file_path: Path, doc: dict):
+            async with semaphore:
+                await asyncio.to_thread(_write_json_file, file_path, doc)
+
+        writes = []
         for idx, doc in enumerate(documents):
             doc_id = doc.get('chunk_id', f'doc_{idx}')
             file_path = temp_dir / f"{doc_id.replace('/', '_').replace('::', '_')}.json"
+            writes.append(write_bounded(file_path, doc))
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(doc, f, indent=2)
+        await asyncio.gather(*writes)
 
         # Update job status
-        ingestion_jobs[job_id]['status'] = JobStatus.COMPLETED
-        ingestion_jobs[job_id]['current_step'] = 'Completed'
-        ingestion_jobs[job_id]['files_fetched'] = len(documents)
-        ingestion_jobs[job_id]['temp_path'] = str(temp_dir)
-        ingestion_jobs[job_id]['progress_percent'] = 100.0
+        await ingestion_jobs.update(
+            job_id,
+            status=JobStatus.COMPLETED,
+            current_step='Completed',
+            files_fetched=len(documents),
+            temp_path=str(temp_dir),
+            progress_percent=100.0
+        )
 
         logger.info(f"Ingestion job {job_id} completed: {len(documents)} documents")
 
     except Exception as e:
         logger.exception(f"Ingestion job {job_id} failed: {e}")
-        ingestion_jobs[job_id]['status'] = JobStatus.FAILED
-        ingestion_jobs[job_id]['error'] = str(e)
+        await ingestion_jobs.update(job_id, status=JobStatus.FAILED, error=str(e))
 
 # ==================== ENDPOINTS ====================
 
@@ -159,14 +280,15 @@ async def fetch_external_data(
     job_id = str(uuid.uuid4())
 
     # Create job entry
-    ingestion_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.PENDING,
-        'current_step': 'Initializing',
-        'progress_percent': 0.0,
-        'files_fetched': 0,
-        'created_at': datetime.utcnow()
-    }
+    await ingestion_jobs.create(
+        job_id,
+        job_id=job_id,
+        status=JobStatus.PENDING,
+        current_step='Initializing',
+        progress_percent=0.0,
+        files_fetched=0,
+        created_at=datetime.utcnow()
+    )
 
     # Start background ingestion
     background_tasks.add_task(
@@ -203,14 +325,15 @@ async def ingest_local_data(background_tasks: BackgroundTasks):
     job_id = str(uuid.uuid4())
 
     # Create job entry
-    ingestion_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.PENDING,
-        'current_step': 'Initializing',
-        'progress_percent': 0.0,
-        'files_fetched': 0,
-        'created_at': datetime.utcnow()
-    }
+    await ingestion_jobs.create(
+        job_id,
+        job_id=job_id,
+        status=JobStatus.PENDING,
+        current_step='Initializing',
+        progress_percent=0.0,
+        files_fetched=0,
+        created_at=datetime.utcnow()
+    )
 
     # Start background ingestion
     background_tasks.add_task(
@@ -260,24 +383,23 @@ async def upload_documents(files: List[UploadFile] = File(...)):
         file_path = temp_dir / file.filename
 
         try:
-            content = await file.read()
-            with open(file_path, 'wb') as f:
-                f.write(content)
+            await asyncio.to_thread(_save_upload, file, file_path)
             uploaded_count += 1
         except Exception as e:
             logger.error(f"Failed to upload {file.filename}: {e}")
             continue
 
     # Create job entry
-    ingestion_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.COMPLETED,
-        'current_step': 'Completed',
-        'progress_percent': 100.0,
-        'files_fetched': uploaded_count,
-        'temp_path': str(temp_dir),
-        'created_at': datetime.utcnow()
-    }
+    await ingestion_jobs.create(
+        job_id,
+        job_id=job_id,
+        status=JobStatus.COMPLETED,
+        current_step='Completed',
+        progress_percent=100.0,
+        files_fetched=uploaded_count,
+        temp_path=str(temp_dir),
+        created_at=datetime.utcnow()
+    )
 
     return IngestionResponse(
         job_id=job_id,
@@ -287,21 +409,26 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     )
 
 @router.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_ingestion_status(job_id: str):
+async def get_ingestion_status(
+    job_id: str,
+    wait: float = Query(0.0, ge=0.0, le=60.0, description="Seconds to wait for the job to finish"),
+    since_status: Optional[str] = Query(None, description="Return early once the status differs from this")
+):
     """
     **Check status of an ingestion job**
 
     **Parameters:**
     - job_id: The job ID returned from /fetch, /local, or /upload
+    - wait: Seconds to hold the request until the job finishes (long polling)
+    - since_status: With wait, also return as soon as the status differs from this
 
     **Returns:**
     - Current job status and progress
     """
-    if job_id not in ingestion_jobs:
+    job = await wait_for_job(ingestion_jobs, job_id, wait, since_status)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-    job = ingestion_jobs[job_id]
-
     return JobStatusResponse(
         job_id=job_id,
         status=job['status'],
@@ -315,15 +442,16 @@ async def get_ingestion_status(job_id: str):
         error=job.get('error')
     )
 
-@router.get("/list")
+@router.get("/list", response_class=FastJSONResponse)
 async def list_ingestion_jobs():
     """
     **List all ingestion jobs**
 
     Returns a list of all ingestion jobs with their current status.
     """
+    jobs = await ingestion_jobs.items()
     return {
-        "total_jobs": len(ingestion_jobs),
+        "total_jobs": len(jobs),
         "jobs": [
             {
                 "job_id": job_id,
@@ -331,6 +459,6 @@ async def list_ingestion_jobs():
                 "files_fetched": job.get('files_fetched', 0),
                 "created_at": job['created_at'].isoformat()
             }
-            for job_id, job in ingestion_jobs.items()
+            for job_id, job in jobs
         ]
     }
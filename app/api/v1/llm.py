@@ -2,11 +2,19 @@
 Endpoint 4: LLM Generation Service
 Synthesizes test procedures and acceptance criteria using LLM
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+import asyncio
+import functools
+import math
+import random
+import re
 import uuid
+import weakref
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 import json
+import orjson
 from pathlib import Path
 
 from app.models.api_models import (
@@ -18,39 +26,264 @@ from app.models.api_models import (
     JobStatusResponse,
     RetrievalQueryRequest
 )
+from app.api.v1.dvp import PTPGenerator
+from app.api.v1.retrieval import get_query_results, query_knowledge_graph
 from app.config import settings
+from app.core.job_store import JobStore, wait_for_job
+from app.core.llm_cache import LLMResponseCache
+from app.core.rate_limit import AsyncTokenBucket
+from app.core.responses import FastJSONResponse
 from loguru import logger
 from google import genai
+from openai import AsyncOpenAI
 
 router = APIRouter()
 
-# In-memory job storage
-llm_jobs = {}
+# Job storage (Redis-backed when settings.redis_url is set)
+llm_jobs = JobStore("llm_jobs")
 
-# LLM Client (will initialize when needed)
-llm_client = None
+# LLM clients per event loop and provider, created when needed
+llm_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+# Centralized PTPGenerator shared by all jobs (DOCX export keeps no state
+# on the instance, so concurrent jobs can use it)
+ptp_generator = PTPGenerator()
+
+# Completions of previously seen prompts
+llm_response_cache = LLMResponseCache()
+
+# Client-side rate limiters keyed by (provider, model), shared by every event
+# loop in the process since the provider's limits apply to the whole process
+rate_limiters: Dict[tuple, AsyncTokenBucket] = {}
+
+# Provider error fragments that indicate a retryable rate limit or overload
+RATE_LIMIT_MARKERS = ("429", "quota", "resource_exhausted", "503")
+
+# Provider error fragments that indicate the prompt exceeded the model context
+CONTEXT_LENGTH_MARKERS = (
+    "context_length_exceeded", "maximum context length", "context window",
+    "input token count", "too many tokens"
+)
+
+# Upper bound for a single retry backoff, in seconds, and for a wait
+# requested by the provider
+MAX_RETRY_DELAY = 60
+MAX_REQUESTED_RETRY_DELAY = 300
+
+# Gemini reports the requested wait as a google.rpc.RetryInfo retryDelay
+# (e.g. "retryDelay": "12s") in the error details
+_RETRY_DELAY_PATTERN = re.compile(r"retry_?delay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+# Requirements per LLM call and the output budget of each call
+SUB_BATCH_SIZE = 4
+SUB_BATCH_MAX_TOKENS = 4096
 
 def get_llm_client():
-    """Get or create LLM client - supports local models (OpenAI) and Google Gemini"""
-    global llm_client
-    
+    """
+    Get or create the async LLM client - supports local models (OpenAI) and Google Gemini
+
+    Clients are cached per provider and event loop, so connection pools are
+    reused across jobs without being shared between worker-thread loops.
+    """
+    if settings.llm_provider == "gemini" and not settings.gemini_api_key:
+        logger.error("Gemini API key not configured")
+        return None
+
+    loop_clients = llm_clients.setdefault(asyncio.get_running_loop(), {})
+    if settings.llm_provider not in loop_clients:
+        loop_clients[settings.llm_provider] = _create_llm_client()
+
+    client = loop_clients[settings.llm_provider]
+    # For the new SDK, we'll use the async view of the Client instance
+    return client.aio if settings.llm_provider == "gemini" else client
+
+def _create_llm_client():
+    """Create the client for the configured provider"""
     if settings.llm_provider == "gemini":
-        if not settings.gemini_api_key:
-            logger.error("Gemini API key not configured")
-            return None
-        # For the new SDK, we'll return a Client instance
         client = genai.Client(api_key=settings.gemini_api_key)
-        return client
-        
-    if llm_client is None:
-        from openai import OpenAI
+        logger.info(f"LLM client initialized for Gemini, model: {settings.gemini_model}")
+    else:
         # Use local LLM server (OpenAI-compatible API)
-        llm_client = OpenAI(
+        client = AsyncOpenAI(
             api_key=settings.openai_api_key or "not-needed",
             base_url=settings.openai_api_base  # Local model endpoint
         )
         logger.info(f"LLM client initialized with base_url: {settings.openai_api_base}, model: {settings.openai_model}")
-    return llm_client
+
+    return client
+
+def get_rate_limiter() -> AsyncTokenBucket:
+    """Get the client-side rate limiter for the active provider and model"""
+    model = settings.gemini_model if settings.llm_provider == "gemini" else settings.openai_model
+    key = (settings.llm_provider, model)
+    limiter = rate_limiters.get(key)
+    if limiter is None:
+        # setdefault keeps one bucket if worker threads race to create it
+        limiter = rate_limiters.setdefault(key, AsyncTokenBucket(
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute
+        ))
+    return limiter
+
+def estimate_tokens(prompt: str, max_output_tokens: int) -> int:
+    """Rough upper bound of tokens a request may consume (~4 chars per token)"""
+    return math.ceil(len(prompt) / 4) + max_output_tokens
+
+def parse_json_array(content: str) -> List[Any]:
+    """
+    Extract the JSON array from an LLM response
+
+    Takes the span from the first '[' to the last ']'. If that does not
+    parse (e.g. the output was truncated), the complete leading elements
+    are salvaged. A lone JSON object is returned as a one-item list.
+    """
+    start = content.find('[')
+    end = content.rfind(']')
+    if start != -1 and end > start:
+        try:
+            return orjson.loads(content[start:end + 1])
+        except orjson.JSONDecodeError:
+            pass
+
+    if start == -1:
+        single = parse_json_object(content) if content.lstrip().startswith('{') else None
+        return [single] if single is not None else []
+
+    # Decode elements one by one until the first incomplete one
+    items = []
+    decoder = json.JSONDecoder()
+    pos = start + 1
+    while True:
+        while pos < len(content) and content[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(content) or content[pos] == ']':
+            break
+        try:
+            item, pos = decoder.raw_decode(content, pos)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+
+    if items:
+        logger.warning(f"Recovered {len(items)} items from malformed JSON array")
+    return items
+
+def parse_json_object(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract a JSON object from an LLM response, or None if there is none
+    """
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        pass
+
+    start = content.find('{')
+    end = content.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        return orjson.loads(content[start:end + 1])
+    except orjson.JSONDecodeError:
+        return None
+
+class JSONArrayStream:
+    """
+    Incrementally extract the elements of a streamed JSON array
+
+    Text is fed as it arrives; feed() returns the objects whose closing brace
+    has been seen. Scanning starts at the first '[', like parse_json_array().
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.items: List[Any] = []
+        self.complete = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        self.text += chunk
+        new_items = []
+        text = self.text
+
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self.complete:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif not self._started:
+                self._started = char == '['
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    self._item_start = pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    self.complete = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        new_items.append(orjson.loads(text[self._item_start:pos + 1]))
+                    except orjson.JSONDecodeError:
+                        logger.warning("Skipping malformed element in streamed JSON array")
+
+        self._pos = len(text)
+        self.items.extend(new_items)
+        return new_items
+
+def is_rate_limited(error: Exception) -> bool:
+    """Check whether an LLM provider error is a rate-limit/overload response"""
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in RATE_LIMIT_MARKERS)
+
+def is_context_length_error(error: Exception) -> bool:
+    """Check whether an LLM provider error means the prompt was too long"""
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in CONTEXT_LENGTH_MARKERS)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Get the wait requested by the provider for a rate-limit error, if any
+
+    Reads the Retry-After header of OpenAI-compatible responses and the
+    RetryInfo delay of Gemini errors.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        if headers.get('retry-after-ms'):
+            try:
+                return float(headers['retry-after-ms']) / 1000
+            except ValueError:
+                pass
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    return max(0.0, retry_at.timestamp() - datetime.now(retry_at.tzinfo).timestamp())
+                except (TypeError, ValueError):
+                    pass
+
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+    return None
 
 def generate_test_procedure_prompt(requirement: Dict[str, Any],
                                    component_profile: Dict[str, Any]) -> str:
@@ -94,30 +327,12 @@ Generate a realistic and detailed test procedure that follows automotive industr
 
     return prompt
 
-def generate_batch_test_procedure_prompt(requirements: List[Dict[str, Any]],
-                                       component_profile: Dict[str, Any]) -> str:
-    """
-    Generate prompt for BATCH test procedure creation
-    """
-    req_texts = []
-    for i, req in enumerate(requirements):
-        text = req.get('text', '')[:500] # Truncate massive requirements
-        req_id = req.get('requirement_id', req.get('node_id', f'REQ_{i}'))
-        req_texts.append(f"Requirement {i+1} (ID: {req_id}): {text}")
-        
-    compiled_requirements = "\n\n".join(req_texts)
-
-    prompt = f"""You are a test engineer creating a Product Testing Plan (PTP).
-
-Component: {component_profile.get('name')}
-Type: {component_profile.get('type')}
-Specs: {json.dumps(component_profile.get('specifications', {}), indent=2)}
-
-Requirements to Test:
-{compiled_requirements}
+# Static part of the batch prompt. Kept first and byte-identical across calls
+# so providers with prompt-prefix caching can reuse it.
+BATCH_PROMPT_INSTRUCTIONS = """You are a test engineer creating a Product Testing Plan (PTP).
 
 Task:
-Generate a list of {len(requirements)} test procedures (one for each requirement) in valid JSON format.
+Generate one test procedure for each requirement below in valid JSON format.
 The output must be a JSON Array of objects.
 
 Each object must have:
@@ -125,100 +340,359 @@ Each object must have:
 - "test_description"
 - "detailed_procedure" (List of strings)
 - "acceptance_criteria"
-- "source_requirement" (Must match the ID provided above)
-- "traceability": {{ "requirement_id": "...", "source_standard": "..." }}
+- "source_requirement" (Must match the requirement ID provided)
+- "traceability": { "requirement_id": "...", "source_standard": "..." }
 
 Example Response Format:
 [
-  {{
+  {
     "test_name": "...",
     "source_requirement": "REQ_001",
     ...
-  }}
+  }
 ]
 """
+
+BATCH_SYSTEM_MESSAGE = "You are an expert automotive test engineer. Return a JSON List of objects only."
+
+# Filler words dropped from requirement text. Negations, modal verbs and
+# quantifiers are deliberately kept because they carry the requirement.
+PROMPT_STOPWORDS = frozenset({
+    'a', 'an', 'the', 'this', 'that', 'these', 'those', 'of', 'which',
+    'its', 'there', 'also', 'such'
+})
+
+# Identifiers, clause numbers and values (e.g. "ISO_16750-4", "5.2.1") are
+# never altered
+_PROTECTED_TOKEN = re.compile(r'[A-Za-z0-9_.:-]{6,}|.*\d')
+
+def compress_requirement_text(text: str) -> str:
+    """
+    Light prompt compression: collapse whitespace and drop filler words
+    """
+    words = text.split()
+    kept = [
+        word for word in words
+        if word.lower() not in PROMPT_STOPWORDS or _PROTECTED_TOKEN.match(word)
+    ]
+    return ' '.join(kept)
+
+def dedupe_requirements(requirements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop requirements repeated by ID or by (normalized) text, keeping the first
+
+    Retrieval can return the same clause text under several node IDs.
+    """
+    seen_ids = set()
+    seen_texts = set()
+    unique = []
+    for req in requirements:
+        req_id = req.get('requirement_id') or req.get('node_id')
+        text_key = ' '.join(req.get('text', '').lower().split())
+        if (req_id and req_id in seen_ids) or (text_key and text_key in seen_texts):
+            continue
+        if req_id:
+            seen_ids.add(req_id)
+        if text_key:
+            seen_texts.add(text_key)
+        unique.append(req)
+    return unique
+
+def pack_by_token_budget(requirements: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """
+    Take requirements in order while their prompt text fits the token budget
+
+    The first requirement is always kept so a long one is not dropped outright.
+    """
+    packed = []
+    used = 0
+    for req in requirements:
+        cost = math.ceil(len(req.get('text', '')[:500]) / 4) + 8  # + ID and numbering
+        if packed and used + cost > budget:
+            break
+        packed.append(req)
+        used += cost
+    return packed
+
+@functools.lru_cache(maxsize=128)
+def _dump_specs(specs_items: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Compact JSON for component specifications, cached per profile
+    """
+    return json.dumps(dict(specs_items), separators=(',', ':'))
+
+def generate_batch_test_procedure_prompt(requirements: List[Dict[str, Any]],
+                                       component_profile: Dict[str, Any]) -> str:
+    """
+    Generate prompt for BATCH test procedure creation
+    """
+    req_texts = []
+    original_chars = 0
+    for i, req in enumerate(requirements):
+        text = req.get('text', '')[:500] # Truncate massive requirements
+        original_chars += len(text)
+        req_id = req.get('requirement_id', req.get('node_id', f'REQ_{i}'))
+        req_texts.append(f"{i+1}. [{req_id}] {compress_requirement_text(text)}")
+
+    compiled_requirements = "\n".join(req_texts)
+    specs = _dump_specs(tuple(component_profile.get('specifications', {}).items()))
+
+    prompt = f"""{BATCH_PROMPT_INSTRUCTIONS}
+Component: {component_profile.get('name')}
+Type: {component_profile.get('type')}
+Specs: {specs}
+
+Requirements to Test ({len(requirements)}, format "N. [ID] text"):
+{compiled_requirements}
+"""
+    compressed_chars = sum(len(text) for text in req_texts)
+    logger.debug(f"Batch prompt: requirement text {original_chars} -> {compressed_chars} chars, ~{len(prompt) // 4} tokens")
     return prompt
 
+def _parse_trace_id(req_id: str) -> Tuple[str, str]:
+    """
+    Split "Standard::Clause::ReqID" into (standard, clause)
+    """
+    std, _, rest = req_id.partition("::")
+    clause, _, _ = rest.partition("::")
+    return std, clause
+
+def trace_fields(source_meta: Dict[str, Any], req_id: str) -> Tuple[str, str]:
+    """
+    Get (source_standard, source_clause) for a requirement
+
+    Uses the retrieval metadata, falling back to parsing an ID of the form
+    "Standard::Clause::ReqID".
+    """
+    std = source_meta.get('source_standard', '')
+    clause = source_meta.get('source_clause', '')
+
+    if not std and "::" in req_id:
+        std, clause = _parse_trace_id(req_id)
+
+    return std, clause
+
+async def generate_batch(client, requirements: List[Dict[str, Any]],
+                         component_profile: Dict[str, Any],
+                         on_procedure: Optional[Callable[[int], Awaitable[None]]] = None
+                         ) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Generate test procedures for one sub-batch of requirements
+
+    The response is streamed and parsed as it arrives; on_procedure is awaited
+    with the number of procedures completed so far. Returns the parsed
+    procedures and the tokens used.
+    """
+    prompt = generate_batch_test_procedure_prompt(requirements, component_profile)
+
+    max_retries = 5
+    retry_delay = 10
+
+    content = ""
+    tokens = 0
+    stream = JSONArrayStream()
+    last_error = None
+
+    model = settings.gemini_model if settings.llm_provider == "gemini" else settings.openai_model
+    cache_key = LLMResponseCache.make_key(prompt, model, settings.openai_temperature)
+    cached = await llm_response_cache.get(cache_key) if settings.llm_cache_enabled else None
+    if cached is not None:
+        logger.info(f"LLM response cache hit for {len(requirements)} requirements")
+        content = cached
+
+    rate_limiter = get_rate_limiter()
+    reservation = estimate_tokens(prompt, SUB_BATCH_MAX_TOKENS)
+
+    # Request bodies are built once and reused across retries
+    if settings.llm_provider == "gemini":
+        full_prompt = f"System: {BATCH_SYSTEM_MESSAGE}\n\nUser: {prompt}"
+    else:
+        messages = [
+            {"role": "system", "content": BATCH_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ]
+
+    for attempt in range(max_retries if cached is None else 0):
+        try:
+            reserved = await rate_limiter.acquire(reservation)
+
+            # Async SDK clients keep the event loop free while waiting.
+            # A retry restarts the stream from scratch.
+            stream = JSONArrayStream()
+            tokens = 0
+            if settings.llm_provider == "gemini":
+                chunks = await client.models.generate_content_stream(
+                    model=settings.gemini_model,
+                    contents=full_prompt,
+                    config={
+                        'temperature': settings.openai_temperature,
+                        'max_output_tokens': SUB_BATCH_MAX_TOKENS,
+                    }
+                )
+                async for chunk in chunks:
+                    if stream.feed(chunk.text or "") and on_procedure:
+                        await on_procedure(len(stream.items))
+                    usage = getattr(chunk, 'usage_metadata', None)
+                    if usage and usage.total_token_count:
+                        tokens = usage.total_token_count
+            else:
+                chunks = await client.chat.completions.create(
+                    model=settings.openai_model,
+                    messages=messages,
+                    temperature=settings.openai_temperature,
+                    max_tokens=SUB_BATCH_MAX_TOKENS,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in chunks:
+                    if chunk.choices and stream.feed(chunk.choices[0].delta.content or "") and on_procedure:
+                        await on_procedure(len(stream.items))
+                    if getattr(chunk, 'usage', None):
+                        tokens = chunk.usage.total_tokens
+            content = stream.text
+
+            rate_limiter.refund(reserved - tokens)
+            break
+
+        except Exception as e:
+            if is_context_length_error(e) and len(requirements) > 1:
+                # Halve the batch and generate both parts instead
+                half = len(requirements) // 2
+                logger.warning(f"Prompt exceeded model context; splitting batch of {len(requirements)}")
+                done = [0, 0]
+
+                def part_callback(part: int) -> Optional[Callable[[int], Awaitable[None]]]:
+                    if on_procedure is None:
+                        return None
+                    async def on_part_procedure(count: int):
+                        done[part] = count
+                        await on_procedure(sum(done))
+                    return on_part_procedure
+
+                (first, first_tokens), (second, second_tokens) = await asyncio.gather(
+                    generate_batch(client, requirements[:half], component_profile, part_callback(0)),
+                    generate_batch(client, requirements[half:], component_profile, part_callback(1))
+                )
+                return first + second, first_tokens + second_tokens
+            if is_rate_limited(e):
+                last_error = e
+                if attempt + 1 == max_retries:
+                    continue
+                # Honour the provider's requested wait, else back off
+                # exponentially. Jitter keeps concurrent jobs from retrying
+                # in lockstep.
+                requested = retry_after_seconds(e)
+                if requested is not None:
+                    wait_time = min(requested, MAX_REQUESTED_RETRY_DELAY) + random.uniform(0, 1)
+                else:
+                    wait_time = min(retry_delay * (2 ** attempt) + random.uniform(0, 1), MAX_RETRY_DELAY)
+                logger.warning(f"Rate limit hit. Retrying in {wait_time:.1f}s...")
+                await asyncio.sleep(wait_time)
+                continue
+            raise e
+    else:
+        # Every attempt was rate limited: fail the sub-batch rather than
+        # report it as producing no procedures
+        if last_error is not None:
+            logger.error(f"Rate limit persisted after {max_retries} attempts")
+            raise last_error
+
+    # Parse Batch Response (streamed elements when the array was complete,
+    # otherwise cached content or a salvage of the truncated output)
+    test_procedures = stream.items if stream.complete else parse_json_array(content)
+    if not test_procedures:
+        logger.error(f"Could not parse JSON list: {content[:100]}")
+
+    # Only complete, non-empty arrays are cached, so a truncated or
+    # malformed completion is retried on the next request
+    if settings.llm_cache_enabled and cached is None and stream.complete and test_procedures:
+        await llm_response_cache.put(cache_key, content)
+
+    return test_procedures, tokens
+
 async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
     """
     Background task for LLM generation
     """
     try:
-        llm_jobs[job_id]['status'] = JobStatus.PROCESSING
-        llm_jobs[job_id]['current_step'] = 'Initializing LLM client'
+        await llm_jobs.update(job_id, status=JobStatus.PROCESSING, current_step='Initializing LLM client')
 
-        client = get_llm_client()
-
-        # Prepare batch prompt
-        results_to_process = request.retrieved_context[:10]  # Limit context
-        
-        prompt = generate_batch_test_procedure_prompt(
-            results_to_process,
-            request.component_profile.model_dump()
+        results_to_process = pack_by_token_budget(
+            dedupe_requirements(request.retrieved_context),
+            settings.llm_context_token_budget
         )
 
-        llm_jobs[job_id]['current_step'] = 'Generating test procedures (Batch)...'
-        
-        max_retries = 5
-        retry_delay = 10
-        
-        content = ""
-        tokens = 0
+        if not results_to_process or all(
+            r.get('relevance_score', 0.0) < settings.llm_min_relevance for r in results_to_process
+        ):
+            logger.warning(f"LLM generation job {job_id}: no confident requirements to generate from")
+            await llm_jobs.update(
+                job_id,
+                status=JobStatus.FAILED,
+                error="No relevant requirements provided for generation"
+            )
+            return
 
-        for attempt in range(max_retries):
-            try:
-                if settings.llm_provider == "gemini":
-                    full_prompt = f"System: You are an expert automotive test engineer. Return a JSON List of objects only.\n\nUser: {prompt}"
-                    
-                    response = client.models.generate_content(
-                        model=settings.gemini_model,
-                        contents=full_prompt,
-                        config={
-                            'temperature': settings.openai_temperature,
-                            'max_output_tokens': 8192, # Increased for batch
-                        }
-                    )
-                    content = response.text
-                    tokens = getattr(response, 'usage_metadata', None).total_token_count if getattr(response, 'usage_metadata', None) else 0
-                else:
-                    response = client.chat.completions.create(
-                        model=settings.openai_model,
-                        messages=[
-                            {"role": "system", "content": "You are an expert automotive test engineer. Return a JSON List of objects only."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=settings.openai_temperature,
-                        max_tokens=8192
-                    )
-                    content = response.choices[0].message.content
-                    tokens = response.usage.total_tokens
-                
-                break
-                
-            except Exception as e:
-                error_str = str(e).lower()
-                if "429" in error_str or "quota" in error_str or "resource_exhausted" in error_str or "503" in error_str:
-                    wait_time = retry_delay * (2 ** attempt)
-                    logger.warning(f"Rate limit hit. Retrying in {wait_time}s...")
-                    import time
-                    time.sleep(wait_time)
-                    continue
-                raise e
+        client = get_llm_client()
 
-        # Parse Batch Response
-        try:
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', content)
-            if json_match:
-                test_procedures = json.loads(json_match.group())
-            else:
-                # Try simple JSON load if no list brackets found (maybe it returned a single object wrapped or not)
-                test_procedures = [json.loads(content)] if content.strip().startswith('{') else []
-                if not test_procedures: 
-                     logger.error(f"Could not parse JSON list: {content[:100]}")
+        # Split context into small sub-batches generated concurrently
+        component_profile = request.component_profile.model_dump()
+        sub_batches = [
+            results_to_process[i:i + SUB_BATCH_SIZE]
+            for i in range(0, len(results_to_process), SUB_BATCH_SIZE)
+        ]
+
+        await llm_jobs.update(job_id, current_step=f'Generating test procedures ({len(sub_batches)} batches)...')
+
+        # Report progress as streamed procedures complete
+        completed = [0] * len(sub_batches)
+
+        def progress_callback(batch_index: int) -> Callable[[int], Awaitable[None]]:
+            async def on_procedure(done: int):
+                completed[batch_index] = done
+                progress = 10.0 + 80.0 * min(sum(completed) / len(results_to_process), 1.0)
+                await llm_jobs.update(job_id, progress_percent=round(progress, 1))
+            return on_procedure
+
+        batch_results = await asyncio.gather(
+            *(
+                generate_batch(client, sub_batch, component_profile, progress_callback(index))
+                for index, sub_batch in enumerate(sub_batches)
+            ),
+            return_exceptions=True
+        )
 
-        except json.JSONDecodeError:
-            logger.error(f"JSON parsing failed for batch response")
+        # Pair each procedure with the requirement it was generated for
+        # (sequential within its sub-batch; extras have no source)
+        # (a sub-batch that raised or produced nothing counts as failed)
+        test_procedures = []
+        sources = []
+        tokens = 0
+        errors = []
+        for sub_batch, batch_result in zip(sub_batches, batch_results):
+            if isinstance(batch_result, Exception):
+                logger.error(f"LLM sub-batch failed: {batch_result}")
+                errors.append(str(batch_result))
+                continue
+            procedures, batch_tokens = batch_result
+            tokens += batch_tokens
+            if not procedures:
+                errors.append(f"No test procedures generated for {len(sub_batch)} requirements")
+                continue
+            for j, proc in enumerate(procedures):
+                test_procedures.append(proc)
+                sources.append(sub_batch[j] if j < len(sub_batch) else None)
+
+        if len(errors) == len(sub_batches):
+            logger.error(f"LLM generation job {job_id}: all {len(sub_batches)} sub-batches failed")
+            await llm_jobs.update(
+                job_id,
+                status=JobStatus.FAILED,
+                error=f"All {len(sub_batches)} generation batches failed: {errors[0]}"
+            )
+            return
+        if errors:
+            logger.warning(f"LLM generation job {job_id}: {len(errors)} of {len(sub_batches)} sub-batches failed")
 
         # Post-process to add source info
         # We need to map back to sources. 
@@ -227,24 +701,14 @@ async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
         # Better: Ask LLM to include "source_id" in response.
         
         # Enforce source mapping (fallback to sequential if LLM missed IDs)
-        for i, proc in enumerate(test_procedures):
-            if i < len(results_to_process):
-                source = results_to_process[i]
+        for proc, source in zip(test_procedures, sources):
+            if source is not None:
                 proc['source_requirement'] = source.get('requirement_id', source.get('node_id', ''))
                 proc['confidence_score'] = source.get('relevance_score', 0.0)
 
                 # Robustness: Ensure traceability exists
                 # Extract from metadata or fallback to parsing ID
-                source_meta = source.get('metadata', {})
-                std = source_meta.get('source_standard', '')
-                clause = source_meta.get('source_clause', '')
-                
-                # Fallback: Parse ID "Standard::Clause::ReqID"
-                if not std and "::" in proc['source_requirement']:
-                    parts = proc['source_requirement'].split("::")
-                    if len(parts) >= 2:
-                        std = parts[0]
-                        clause = parts[1]
+                std, clause = trace_fields(source.get('metadata', {}), proc['source_requirement'])
 
                 if 'traceability' not in proc:
                     proc['traceability'] = {
@@ -258,15 +722,18 @@ async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
                         proc['traceability']['source_standard'] = std
                     if not proc['traceability'].get('source_clause'):
                         proc['traceability']['source_clause'] = clause
-                
-                # Create AC
-                if 'acceptance_criteria' in proc:
-                    acceptance_criteria.append({
-                        'criteria_id': f"AC_{i+1}",
-                        'test_id': f"B{i+1}",
-                        'criteria_text': proc['acceptance_criteria'],
-                        'source_requirement': proc['source_requirement']
-                    })
+
+        # Create AC for every mapped procedure that has criteria
+        acceptance_criteria = [
+            {
+                'criteria_id': f"AC_{i+1}",
+                'test_id': f"B{i+1}",
+                'criteria_text': proc['acceptance_criteria'],
+                'source_requirement': proc['source_requirement']
+            }
+            for i, (proc, source) in enumerate(zip(test_procedures, sources))
+            if source is not None and 'acceptance_criteria' in proc
+        ]
 
         # Update job status
         result_payload = {
@@ -274,29 +741,31 @@ async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
             'acceptance_criteria': acceptance_criteria,
             'tokens_used': tokens,
             'procedures_generated': len(test_procedures),
-            'component_profile': request.component_profile.model_dump()
+            'sub_batches': len(sub_batches),
+            'failed_sub_batches': len(errors),
+            'sub_batch_errors': errors,
+            'component_profile': component_profile
         }
         
-        llm_jobs[job_id]['result'] = result_payload
-        llm_jobs[job_id]['status'] = JobStatus.COMPLETED
-        llm_jobs[job_id]['current_step'] = 'Completed'
-        llm_jobs[job_id]['progress_percent'] = 100.0
+        await store_job_result(job_id, result_payload)
+        await llm_jobs.update(
+            job_id,
+            status=JobStatus.COMPLETED,
+            current_step='Completed',
+            progress_percent=100.0
+        )
 
         if result_payload:
              # Save to file for persistence
-            import os
-            from pathlib import Path
             output_dir = Path("output")
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Use centralized PTPGenerator
-            from app.api.v1.dvp import PTPGenerator
-            generator = PTPGenerator()
-            
             # Save DOCX using existing project standard
             try:
-                output_path = generator.generate_ptp_docx(
-                    component_profile=request.component_profile.model_dump(),
+                # python-docx is CPU-bound; keep it off the event loop
+                output_path = await asyncio.to_thread(
+                    ptp_generator.generate_ptp_docx,
+                    component_profile=component_profile,
                     test_cases=test_procedures,
                     include_traceability=request.include_traceability
                 )
@@ -304,8 +773,9 @@ async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
                 # Add download URL to result
                 filename = Path(output_path).name
                 download_url = f"/static/output/{filename}"
-                llm_jobs[job_id]['result']['download_url'] = download_url
-                llm_jobs[job_id]['result']['file_name'] = filename
+                result_payload['download_url'] = download_url
+                result_payload['file_name'] = filename
+                await store_job_result(job_id, result_payload)
                 
                 logger.info(f"LLM generation job {job_id} completed. Saved to {output_path}")
             except Exception as docx_err:
@@ -313,12 +783,77 @@ async def process_llm_generation(job_id: str, request: LLMGenerationRequest):
 
     except Exception as e:
         logger.exception(f"LLM generation job {job_id} failed: {e}")
-        llm_jobs[job_id]['status'] = JobStatus.FAILED
-        llm_jobs[job_id]['error'] = str(e)
+        await llm_jobs.update(job_id, status=JobStatus.FAILED, error=str(e))
+
+
 
 
 
+def _write_job_result(result_path: Path, result_payload: Dict[str, Any]):
+    """
+    Write a generation result to disk (runs on a worker thread)
+    """
+    result_path.parent.mkdir(parents=True, exist_ok=True)
+    result_path.write_bytes(orjson.dumps(result_payload))
+
+async def store_job_result(job_id: str, result_payload: Dict[str, Any]):
+    """
+    Write the full generation result to disk and keep only a summary in the job
+
+    Procedures and acceptance criteria can be large, so they are not held in
+    the job store; load_job_result() reads them back for /status. The result
+    is serialized and written off the event loop.
+    """
+    result_path = Path(settings.output_dir) / "llm_results" / f"{job_id}.json"
+    await asyncio.to_thread(_write_job_result, result_path, result_payload)
+
+    summary = {
+        key: result_payload[key]
+        for key in ('procedures_generated', 'tokens_used', 'sub_batches', 'failed_sub_batches',
+                    'download_url', 'file_name')
+        if key in result_payload
+    }
+    await llm_jobs.update(job_id, result=summary, result_path=str(result_path))
 
+def _read_job_result(result_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a stored generation result (runs on a worker thread)
+    """
+    try:
+        return orjson.loads(Path(result_path).read_bytes())
+    except FileNotFoundError:
+        return None
+
+async def load_job_result(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Get the full result of a completed generation job
+
+    Results can be large, so the file is read and parsed off the event loop.
+    """
+    result_path = job.get('result_path')
+    if result_path:
+        result = await asyncio.to_thread(_read_job_result, result_path)
+        if result is not None:
+            return result
+    return job.get('result')
+
+def dispatch_generation(background_tasks: BackgroundTasks, job_id: str,
+                        request: LLMGenerationRequest, deterministic: bool):
+    """
+    Schedule a generation job on the task queue, or in-process as a fallback
+    """
+    if settings.task_queue_enabled:
+        from app.workers.llm_worker import run_deterministic_generation, run_llm_generation
+
+        actor = run_deterministic_generation if deterministic else run_llm_generation
+        actor.send(job_id, request.model_dump(mode='json'))
+        return
+
+    background_tasks.add_task(
+        process_deterministic_generation if deterministic else process_llm_generation,
+        job_id,
+        request
+    )
 
 # ==================== ENDPOINTS ====================
 
@@ -359,6 +894,10 @@ async def generate_test_procedures(
     }
     ```
 
+    Instead of posting the context, `retrieved_context_ref` may name the
+    query_id of a recent /retrieval/query call; `max_context` limits how
+    many context items are used.
+
     **Returns:**
     - Test procedures with detailed steps
     - Acceptance criteria
@@ -376,30 +915,37 @@ async def generate_test_procedures(
             detail="Google API key not configured for Gemini provider."
         )
 
+    # Resolve context held on the server from the retrieval step
+    if request.retrieved_context_ref:
+        context = get_query_results(request.retrieved_context_ref)
+        if context is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Retrieval results for query {request.retrieved_context_ref} not found or expired"
+            )
+        request.retrieved_context = context
+    if request.max_context is not None:
+        request.retrieved_context = request.retrieved_context[:request.max_context]
+
     job_id = str(uuid.uuid4())
 
     # Create job entry
-    llm_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.PENDING,
-        'current_step': 'Initializing',
-        'progress_percent': 0.0,
-        'created_at': datetime.utcnow()
-    }
+    await llm_jobs.create(
+        job_id,
+        job_id=job_id,
+        status=JobStatus.PENDING,
+        current_step='Initializing',
+        progress_percent=0.0,
+        created_at=datetime.utcnow()
+    )
 
     # Start background processing based on method
-    if getattr(request, 'generation_method', 'llm') == 'deterministic':
-        background_tasks.add_task(
-            process_deterministic_generation,
-            job_id,
-            request
-        )
-    else:
-        background_tasks.add_task(
-            process_llm_generation,
-            job_id,
-            request
-        )
+    dispatch_generation(
+        background_tasks,
+        job_id,
+        request,
+        deterministic=getattr(request, 'generation_method', 'llm') == 'deterministic'
+    )
 
     return LLMGenerationResponse(
         job_id=job_id,
@@ -412,29 +958,34 @@ async def generate_test_procedures(
     )
 
 @router.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_llm_generation_status(job_id: str):
+async def get_llm_generation_status(
+    job_id: str,
+    wait: float = Query(0.0, ge=0.0, le=60.0, description="Seconds to wait for the job to finish"),
+    since_status: Optional[str] = Query(None, description="Return early once the status differs from this")
+):
     """
     **Check LLM generation job status**
 
     **Parameters:**
     - job_id: Job ID from /generate endpoint
+    - wait: Seconds to hold the request until the job finishes (long polling)
+    - since_status: With wait, also return as soon as the status differs from this
 
     **Returns:**
     - Current status and progress
     - Result when completed (test procedures, tokens used)
     """
-    if job_id not in llm_jobs:
+    job = await wait_for_job(llm_jobs, job_id, wait, since_status)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-    job = llm_jobs[job_id]
-
     return JobStatusResponse(
         job_id=job_id,
         status=job['status'],
         progress_percent=job.get('progress_percent', 0.0),
         current_step=job.get('current_step', 'Unknown'),
         message=f"LLM generation: {job.get('current_step', 'Processing')}",
-        result=job.get('result') if job['status'] == JobStatus.COMPLETED else None,
+        result=await load_job_result(job) if job['status'] == JobStatus.COMPLETED else None,
         error=job.get('error')
     )
 
@@ -443,12 +994,16 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
     Generates test plan deterministically (without LLM) using KG results directly.
     """
     try:
-        llm_jobs[job_id]['status'] = JobStatus.PROCESSING
-        llm_jobs[job_id]['current_step'] = 'Retrieving requirements'
-        llm_jobs[job_id]['progress_percent'] = 10.0
+        await llm_jobs.update(
+            job_id,
+            status=JobStatus.PROCESSING,
+            current_step='Retrieving requirements',
+            progress_percent=10.0
+        )
+
+        component_profile = request.component_profile.model_dump()
 
         # 1. Retrieve Context from Knowledge Graph
-        from app.api.v1.retrieval import query_knowledge_graph
         
         if request.component_profile.test_categories:
             cats = ", ".join(request.component_profile.test_categories)
@@ -461,7 +1016,7 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
             n_results=100, # Get more candidates
             min_confidence=0.4, # Lower threshold for deterministic
             include_metadata=True,
-            component_profile=request.component_profile.model_dump()
+            component_profile=component_profile
         )
 
         response = await query_knowledge_graph(query_request)
@@ -469,43 +1024,35 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
         
         if not results:
             logger.warning("No relevant nodes found in Knowledge Graph.")
-            llm_jobs[job_id]['status'] = JobStatus.FAILED
-            llm_jobs[job_id]['error'] = "No relevant requirements found in Knowledge Graph"
+            await llm_jobs.update(
+                job_id,
+                status=JobStatus.FAILED,
+                error="No relevant requirements found in Knowledge Graph"
+            )
             return
 
         # 2. Limit results
         results_to_process = results[:20]  # Process top 20 verified results
         
-        test_procedures = []
-        acceptance_criteria = []
-
-        llm_jobs[job_id]['current_step'] = 'Formatting test procedures'
-        
-        for idx, result in enumerate(results_to_process):
-            # Deterministic Mapping
-            # Use Node text as requirement/description
-            req_text = result.get('text', '')
-            req_id = result.get('metadata', {}).get('source_clause', result.get('node_id', f'REQ_{idx}'))
-            
-            # Create a structured procedure object directly
-            
-            # Robust extraction of standard/clause
-            source_meta = result.get('metadata', {})
-            std = source_meta.get('source_standard', '')
-            clause = source_meta.get('source_clause', '')
-            
-            # Fallback: Parse ID "Standard::Clause::ReqID"
-            if not std and "::" in req_id:
-                parts = req_id.split("::")
-                if len(parts) >= 2:
-                    std = parts[0]
-                    clause = parts[1]
-
-            procedure_data = {
+        await llm_jobs.update(job_id, current_step='Formatting test procedures')
+
+        # Deterministic mapping: pull each field out for all results in one
+        # pass, then build procedures and acceptance criteria together
+        metas = [result.get('metadata', {}) for result in results_to_process]
+        req_texts = [result.get('text', '') for result in results_to_process]
+        req_ids = [
+            meta.get('source_clause', result.get('node_id', f'REQ_{idx}'))
+            for idx, (result, meta) in enumerate(zip(results_to_process, metas))
+        ]
+        traces = [trace_fields(meta, req_id) for meta, req_id in zip(metas, req_ids)]
+        component_name = request.component_profile.name
+
+        test_procedures = [
+            {
                 "test_name": f"Test for {req_id}",
                 "test_description": req_text[:200] + "..." if len(req_text) > 200 else req_text,
                 "detailed_procedure": [
-                    f"1. Setup the {request.component_profile.name} in the test chamber.",
+                    f"1. Setup the {component_name} in the test chamber.",
                     f"2. Configure test parameters according to {req_id}.",
                     f"3. Verify: {req_text}",
                     "4. Record observations and measurements.",
@@ -520,16 +1067,19 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
                     "source_standard": std
                 }
             }
-            
-            test_procedures.append(procedure_data)
-            
-            # AC
-            acceptance_criteria.append({
+            for result, req_text, req_id, (std, clause)
+            in zip(results_to_process, req_texts, req_ids, traces)
+        ]
+
+        acceptance_criteria = [
+            {
                 'criteria_id': f"AC_{idx+1}",
                 'test_id': f"B{idx+1}",
-                'criteria_text': procedure_data['acceptance_criteria'],
-                'source_requirement': req_id
-            })
+                'criteria_text': procedure['acceptance_criteria'],
+                'source_requirement': procedure['source_requirement']
+            }
+            for idx, procedure in enumerate(test_procedures)
+        ]
 
         # Save Result
         result_payload = {
@@ -537,29 +1087,28 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
             'acceptance_criteria': acceptance_criteria,
             'tokens_used': 0,
             'procedures_generated': len(test_procedures),
-            'component_profile': request.component_profile.model_dump()
+            'component_profile': component_profile
         }
         
-        llm_jobs[job_id]['status'] = JobStatus.COMPLETED
-        llm_jobs[job_id]['current_step'] = 'Completed'
-        llm_jobs[job_id]['progress_percent'] = 100.0
-        llm_jobs[job_id]['result'] = result_payload
+        await store_job_result(job_id, result_payload)
+        await llm_jobs.update(
+            job_id,
+            status=JobStatus.COMPLETED,
+            current_step='Completed',
+            progress_percent=100.0
+        )
 
         if result_payload:
              # Save to file for persistence
-            import os
-            from pathlib import Path
             output_dir = Path("output")
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Use centralized PTPGenerator
-            from app.api.v1.dvp import PTPGenerator
-            generator = PTPGenerator()
-            
             # Save DOCX using existing project standard
             try:
-                output_path = generator.generate_ptp_docx(
-                    component_profile=request.component_profile.model_dump(),
+                # python-docx is CPU-bound; keep it off the event loop
+                output_path = await asyncio.to_thread(
+                    ptp_generator.generate_ptp_docx,
+                    component_profile=component_profile,
                     test_cases=test_procedures,
                     include_traceability=request.include_traceability
                 )
@@ -567,8 +1116,9 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
                 # Add download URL to result
                 filename = Path(output_path).name
                 download_url = f"/static/output/{filename}"
-                llm_jobs[job_id]['result']['download_url'] = download_url
-                llm_jobs[job_id]['result']['file_name'] = filename
+                result_payload['download_url'] = download_url
+                result_payload['file_name'] = filename
+                await store_job_result(job_id, result_payload)
 
                 logger.info(f"Deterministic generation job {job_id} completed. Saved to {output_path}")
             except Exception as docx_err:
@@ -577,8 +1127,7 @@ async def process_deterministic_generation(job_id: str, request: LLMGenerationRe
 
     except Exception as e:
         logger.exception(f"Deterministic generation job {job_id} failed: {e}")
-        llm_jobs[job_id]['status'] = JobStatus.FAILED
-        llm_jobs[job_id]['error'] = str(e)
+        await llm_jobs.update(job_id, status=JobStatus.FAILED, error=str(e))
 
 @router.post("/generate-deterministic", response_model=LLMGenerationResponse)
 async def generate_test_procedures_deterministic(
@@ -592,20 +1141,17 @@ async def generate_test_procedures_deterministic(
     """
     job_id = str(uuid.uuid4())
 
-    llm_jobs[job_id] = {
-        'job_id': job_id,
-        'status': JobStatus.PENDING,
-        'current_step': 'Initializing',
-        'progress_percent': 0.0,
-        'created_at': datetime.utcnow()
-    }
-
-    background_tasks.add_task(
-        process_deterministic_generation,
+    await llm_jobs.create(
         job_id,
-        request
+        job_id=job_id,
+        status=JobStatus.PENDING,
+        current_step='Initializing',
+        progress_percent=0.0,
+        created_at=datetime.utcnow()
     )
 
+    dispatch_generation(background_tasks, job_id, request, deterministic=True)
+
     return LLMGenerationResponse(
         job_id=job_id,
         status=JobStatus.PENDING,
@@ -616,7 +1162,7 @@ async def generate_test_procedures_deterministic(
         timestamp=datetime.utcnow()
     )
 
-@router.post("/generate-simple")
+@router.post("/generate-simple", response_class=FastJSONResponse)
 async def generate_simple_test_procedure(
     requirement_text: str,
     component_type: str,
@@ -663,9 +1209,12 @@ Provide a JSON response with:
 - detailed_procedure
 - acceptance_criteria"""
 
+        rate_limiter = get_rate_limiter()
+        reserved = await rate_limiter.acquire(estimate_tokens(prompt, 1000))
+
         if settings.llm_provider == "gemini":
             full_prompt = f"System: You are an automotive test engineer. Always respond with valid JSON only.\n\nUser: {prompt}"
-            response = client.models.generate_content(
+            response = await client.models.generate_content(
                 model=settings.gemini_model,
                 contents=full_prompt,
                 config={
@@ -674,9 +1223,10 @@ Provide a JSON response with:
                 }
             )
             content = response.text
-            tokens = getattr(response, 'usage_metadata', None).total_token_count if getattr(response, 'usage_metadata', None) else 0
+            usage = getattr(response, 'usage_metadata', None)
+            tokens = (usage.total_token_count or 0) if usage else 0
         else:
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=settings.openai_model,
                 messages=[
                     {"role": "system", "content": "You are an automotive test engineer. Always respond with valid JSON only."},
@@ -686,17 +1236,14 @@ Provide a JSON response with:
                 max_tokens=1000
             )
             content = response.choices[0].message.content
-            tokens = response.usage.total_tokens
+            tokens = response.usage.total_tokens if response.usage else 0
+
+        rate_limiter.refund(reserved - tokens)
+
         # Try to extract JSON from the response
-        try:
-            result = json.loads(content)
-        except json.JSONDecodeError:
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                result = json.loads(json_match.group())
-            else:
-                raise ValueError(f"Could not parse JSON from response: {content[:200]}")
+        result = parse_json_object(content)
+        if result is None:
+            raise ValueError(f"Could not parse JSON from response: {content[:200]}")
 
         return {
             "test_procedure": result,
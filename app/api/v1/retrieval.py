@@ -3,8 +3,11 @@ Endpoint 3: Context Retrieval
 Hybrid search combining semantic + graph traversal
 """
 from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
+import heapq
 import uuid
+import numpy as np
 from datetime import datetime
 from pathlib import Path
 
@@ -12,10 +15,54 @@ from app.models.api_models import (
     RetrievalQueryRequest,
     RetrievalResponse
 )
+from app.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.result_cache import RetrievalResultCache
 from loguru import logger
 
 router = APIRouter()
 
+# Results of recent queries against the current graph; cleared by the graph
+# endpoints whenever a graph is built or loaded
+result_cache = RetrievalResultCache(
+    ttl=settings.retrieval_cache_ttl_seconds,
+    max_entries=settings.retrieval_cache_max_entries
+)
+
+# Results returned for recent query IDs, so generation requests can refer to
+# them instead of posting them back
+query_results = RetrievalResultCache(
+    ttl=settings.retrieval_cache_ttl_seconds,
+    max_entries=settings.retrieval_cache_max_entries
+)
+
+# Common test-related keywords added for each test category
+KEYWORD_MAP = {
+    'thermal': ('temperature', 'heat', 'thermal', 'cold', 'hot', 'celsius', '°c', 'climate', 'shock'),
+    'mechanical': ('vibration', 'shock', 'mechanical', 'force', 'stress', 'impact', 'drop'),
+    'environmental': ('humidity', 'water', 'dust', 'environment', 'climate', 'moisture', 'salt', 'corrosion', 'ingress'),
+    'electrical': ('voltage', 'current', 'electrical', 'power', 'resistance', 'insulation', 'dielectric', 'short'),
+    'emc': ('emc', 'electromagnetic', 'interference', 'emission', 'immunity', 'electrostatic', 'esd', 'conducted', 'radiated'),
+    'durability': ('durability', 'life', 'cycle', 'endurance', 'aging', 'wear')
+}
+
+def clear_result_cache():
+    """Invalidate cached retrieval results after the graph changes"""
+    result_cache.clear()
+
+def get_query_results(query_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Results returned for a recent query, or None once they have expired"""
+    results = query_results.get(query_id)
+    return [dict(result) for result in results] if results is not None else None
+
+def cache_metadata(hit: bool) -> Dict[str, Any]:
+    """Result cache counters reported with each query"""
+    return {
+        'cache_hit': hit,
+        'cache_hits': result_cache.hits,
+        'cache_misses': result_cache.misses
+    }
+
 @router.post("/query", response_model=RetrievalResponse)
 async def query_knowledge_graph(request: RetrievalQueryRequest):
     """
@@ -62,6 +109,23 @@ async def query_knowledge_graph(request: RetrievalQueryRequest):
     job_id = str(uuid.uuid4())
 
     try:
+        # Repeated queries (e.g. iterating on one component profile) reuse
+        # the previous result set
+        cache_key = RetrievalResultCache.make_key(**request.model_dump(mode='json'))
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            results, metadata = cached
+            query_results.put(query_id, results)
+            return RetrievalResponse(
+                job_id=job_id,
+                query_id=query_id,
+                status="completed",
+                results=[dict(result) for result in results],
+                total_results=len(results),
+                retrieval_metadata={**metadata, **cache_metadata(hit=True)},
+                timestamp=datetime.utcnow()
+            )
+
         # Build search keywords from component profile
         component = request.component_profile
         
@@ -75,20 +139,6 @@ async def query_knowledge_graph(request: RetrievalQueryRequest):
             
         logger.info(f"Semantic Query: {query_text}")
 
-        # Execute Semantic Search
-        semantic_results = {}
-        if search_engine:
-            try:
-                # We search for more results than requested to allow for filtering
-                sem_hits = search_engine.search_requirements(query_text, n_results=max(100, request.max_results * 2))
-                for hit in sem_hits:
-                    semantic_results[hit['node_id']] = hit
-                logger.info(f"Semantic search returned {len(sem_hits)} hits")
-            except Exception as e:
-                logger.error(f"Semantic search failed: {e}")
-        else:
-            logger.warning("Search engine not initialized. Skipping semantic search.")
-
         # 2. Keyword Search Construction
         search_terms = []
         search_terms.extend(component.type.lower().split())
@@ -96,122 +146,137 @@ async def query_knowledge_graph(request: RetrievalQueryRequest):
         search_terms.extend([cat.lower() for cat in component.test_categories])
 
         # Add common test-related keywords
-        keyword_map = {
-            'thermal': ['temperature', 'heat', 'thermal', 'cold', 'hot', 'celsius', '°c', 'climate', 'shock'],
-            'mechanical': ['vibration', 'shock', 'mechanical', 'force', 'stress', 'impact', 'drop'],
-            'environmental': ['humidity', 'water', 'dust', 'environment', 'climate', 'moisture', 'salt', 'corrosion', 'ingress'],
-            'electrical': ['voltage', 'current', 'electrical', 'power', 'resistance', 'insulation', 'dielectric', 'short'],
-            'emc': ['emc', 'electromagnetic', 'interference', 'emission', 'immunity', 'electrostatic', 'esd', 'conducted', 'radiated'],
-            'durability': ['durability', 'life', 'cycle', 'endurance', 'aging', 'wear']
-        }
-
         for cat in component.test_categories:
-            if cat.lower() in keyword_map:
-                search_terms.extend(keyword_map[cat.lower()])
-        
-        # Clean unique terms
-        search_terms = list(set([t.lower() for t in search_terms if len(t) > 2]))
+            search_terms.extend(KEYWORD_MAP.get(cat.lower(), ()))
+
+        # Clean unique terms (first occurrence order)
+        search_terms = [t for t in dict.fromkeys(t.lower() for t in search_terms) if len(t) > 2]
         logger.info(f"Keyword Search terms: {search_terms}")
 
+        # Semantic and keyword searches are independent and CPU-bound, so they
+        # run concurrently on worker threads
+        n_semantic = max(100, request.max_results * 2)
+
+        def semantic_search() -> Dict[str, Dict[str, Any]]:
+            # We search for more results than requested to allow for filtering
+            sem_hits = search_engine.search_requirements(query_text, n_results=n_semantic)
+            logger.info(f"Semantic search returned {len(sem_hits)} hits")
+
+            # Keep the best-scoring hit when a node is returned more than once
+            results = {}
+            for hit in sem_hits:
+                best = results.get(hit['node_id'])
+                if best is None or hit['relevance_score'] > best['relevance_score']:
+                    results[hit['node_id']] = hit
+            return results
+
+        keyword_index = graph_builder.get_keyword_index()
+        keyword_search = asyncio.to_thread(keyword_index.match_rows, search_terms)
+
+        if search_engine:
+            semantic_results, keyword_matches = await asyncio.gather(
+                asyncio.to_thread(semantic_search),
+                keyword_search,
+                return_exceptions=True
+            )
+        else:
+            logger.warning("Search engine not initialized. Skipping semantic search.")
+            semantic_results, keyword_matches = {}, await keyword_search
+
+        if isinstance(keyword_matches, Exception):
+            raise keyword_matches
+        if isinstance(semantic_results, Exception):
+            logger.error(f"Semantic search failed: {semantic_results}")
+            semantic_results = {}
+
         # 3. Hybrid Merge and Scoring
-        combined_results = {}
-        
-        # Helper to get existing entry or create new
-        def get_or_create_result(node_id, node_data):
-            if node_id not in combined_results:
-                combined_results[node_id] = {
-                    'node_id': node_id,
-                    'node_type': 'Requirement',
-                    'requirement_id': node_id,
-                    'requirement_type': node_data.get('requirement_type', 'mandatory'),
-                    'text': node_data.get('text', ''),
-                    'keyword': node_data.get('keyword', 'shall'),
-                    'parent_clause': node_data.get('parent_clause', ''),
-                    'semantic_score': 0.0,
-                    'keyword_score': 0.0,
-                    'matched_terms': [],
-                    'retrieval_method': 'hybrid'
-                }
-            return combined_results[node_id]
-
-        # Process Semantic Results
-        start_time = datetime.utcnow()
-        for node_id, hit in semantic_results.items():
-            if graph_builder.graph.has_node(node_id):
-                node_data = graph_builder.graph.nodes[node_id]
-                res = get_or_create_result(node_id, node_data)
-                res['semantic_score'] = hit['relevance_score']
-
-        # Process Keyword Search (Scan all nodes - naive but effective for small graphs < 10k nodes)
-        # For larger graphs, we would rely more on semantic search or inverted index
-        for node_id, node_data in graph_builder.graph.nodes(data=True):
-            if node_data.get('node_type') != 'Requirement':
-                continue
-
-            # Get requirement text
-            req_text = node_data.get('text', '').lower()
-            if not req_text:
-                continue
-
-            # Calculate relevance score based on keyword matches
-            matches = 0
-            curr_matched_terms = []
-            for term in search_terms:
-                if term in req_text:
-                    matches += 1
-                    curr_matched_terms.append(term)
-            
-            if matches > 0:
-                # Get or create result (might exist from semantic)
-                res = get_or_create_result(node_id, node_data)
-                
-                # Normalize keyword score. 
-                # Assuming 5 matches is "very good" (1.0).
-                # New formula: Score = matches / 6.0, cap at 1.0
-                k_score = min(1.0, matches / 6.0)
-                
-                # Boost if mandatory
-                if node_data.get('requirement_type') == 'mandatory':
-                    k_score = min(1.0, k_score * 1.2)
-                
-                res['keyword_score'] = k_score
-                res['matched_terms'] = curr_matched_terms
+        # Candidates are scored column-wise: semantic hits first, then
+        # keyword-only matches, each in the order they were found
+        candidate_ids = [node_id for node_id in semantic_results if graph_builder.graph.has_node(node_id)]
+        position = {node_id: i for i, node_id in enumerate(candidate_ids)}
+        s_scores = [semantic_results[node_id]['relevance_score'] for node_id in candidate_ids]
+
+        # Process Keyword Search (matched via the graph's inverted index)
+        keyword_rows, term_mask = keyword_matches
+
+        # Normalize keyword score for all matches at once.
+        # Assuming 5 matches is "very good" (1.0).
+        # New formula: Score = matches / 6.0, cap at 1.0
+        row_scores = np.minimum(1.0, term_mask.sum(axis=1) / 6.0)
+
+        # Boost if mandatory
+        row_scores = np.where(
+            keyword_index.mandatory[keyword_rows],
+            np.minimum(1.0, row_scores * 1.2),
+            row_scores
+        )
+
+        matched_terms = {}
+        keyword_positions = []
+        for row, mask in zip(keyword_rows.tolist(), term_mask):
+            node_id = keyword_index.node_ids[row]
+            if node_id not in position:
+                position[node_id] = len(candidate_ids)
+                candidate_ids.append(node_id)
+                s_scores.append(0.0)
+            keyword_positions.append(position[node_id])
+            matched_terms[node_id] = [search_terms[column] for column in np.flatnonzero(mask)]
+
+        s_scores = np.asarray(s_scores, dtype=float)
+        k_scores = np.zeros(len(candidate_ids))
+        k_scores[keyword_positions] = row_scores
 
         # 4. Final Scoring and Ranking
-        final_list = []
-        for res in combined_results.values():
-            # Hybrid Score Formula:
-            # If both exist: weighted average + boost
-            # If only one: use that score * penalty
-            
-            s_score = res['semantic_score']
-            k_score = res['keyword_score']
-            
-            final_score = 0.0
-            
-            if s_score > 0 and k_score > 0:
-                # Reinforcement: high semantic AND keyword match
-                final_score = (0.6 * s_score) + (0.4 * k_score) + 0.1 # Boost for dual match
-            elif s_score > 0:
-                # Only semantic (maybe vocabulary mismatch)
-                final_score = s_score * 0.9 
-            elif k_score > 0:
-                # Only keyword (maybe specific technical term)
-                final_score = k_score * 0.8
-            
-            final_score = min(1.0, final_score)
-            res['relevance_score'] = round(final_score, 3)
-            
-            if final_score >= request.min_confidence:
-                final_list.append(res)
+        # Hybrid Score Formula:
+        # If both exist: weighted average + boost for dual match
+        # If only one: use that score * penalty (semantic-only may be a
+        # vocabulary mismatch, keyword-only a specific technical term)
+        has_s = s_scores > 0
+        has_k = k_scores > 0
+        final_scores = np.minimum(1.0, np.select(
+            [has_s & has_k, has_s, has_k],
+            [(0.6 * s_scores) + (0.4 * k_scores) + 0.1, s_scores * 0.9, k_scores * 0.8],
+            default=0.0
+        ))
 
-        # Sort by relevance score
-        final_list.sort(key=lambda x: x['relevance_score'], reverse=True)
+        # Top results by relevance score (ties keep candidate order, as with
+        # a stable descending sort)
+        kept = np.flatnonzero(final_scores >= request.min_confidence).tolist()
+        relevance = {i: round(score, 3) for i, score in zip(kept, final_scores[kept].tolist())}
+        ranked = heapq.nlargest(request.max_results, kept, key=relevance.__getitem__)
 
-        # Limit results
-        final_results = final_list[:request.max_results]
-        
-        logger.info(f"Retrieval complete. Found {len(final_results)} items (Total candidates: {len(combined_results)})")
+        # Only the returned candidates are materialized
+        final_results = []
+        for i in ranked:
+            node_id = candidate_ids[i]
+            node_data = graph_builder.graph.nodes[node_id]
+            final_results.append({
+                'node_id': node_id,
+                'node_type': 'Requirement',
+                'requirement_id': node_id,
+                'requirement_type': node_data.get('requirement_type', 'mandatory'),
+                'text': node_data.get('text', ''),
+                'keyword': node_data.get('keyword', 'shall'),
+                'parent_clause': node_data.get('parent_clause', ''),
+                'semantic_score': s_scores[i].item(),
+                'keyword_score': k_scores[i].item(),
+                'matched_terms': matched_terms.get(node_id, []),
+                'retrieval_method': 'hybrid',
+                'relevance_score': relevance[i]
+            })
+
+        logger.info(f"Retrieval complete. Found {len(final_results)} items (Total candidates: {len(candidate_ids)})")
+
+        metadata = {
+            'search_terms': search_terms,
+            'total_requirements_searched': len(graph_builder.get_requirement_nodes()),
+            'candidates_found': len(candidate_ids),
+            'filtered_by_confidence': request.min_confidence,
+            'semantic_hits': len(semantic_results),
+            'retrieval_method': 'hybrid'
+        }
+        result_cache.put(cache_key, ([dict(result) for result in final_results], metadata))
+        query_results.put(query_id, final_results)
 
         return RetrievalResponse(
             job_id=job_id,
@@ -219,14 +284,7 @@ async def query_knowledge_graph(request: RetrievalQueryRequest):
             status="completed",
             results=final_results,
             total_results=len(final_results),
-            retrieval_metadata={
-                'search_terms': search_terms,
-                'total_requirements_searched': sum(1 for _, d in graph_builder.graph.nodes(data=True) if d.get('node_type') == 'Requirement'),
-                'candidates_found': len(combined_results),
-                'filtered_by_confidence': request.min_confidence,
-                'semantic_hits': len(semantic_results),
-                'retrieval_method': 'hybrid'
-            },
+            retrieval_metadata={**metadata, **cache_metadata(hit=False)},
             timestamp=datetime.utcnow()
         )
 
@@ -234,7 +292,7 @@ async def query_knowledge_graph(request: RetrievalQueryRequest):
         logger.exception(f"Retrieval query failed: {e}")
         raise HTTPException(status_code=500, detail=f"Retrieval failed: {str(e)}")
 
-@router.get("/explain/{query_id}")
+@router.get("/explain/{query_id}", response_class=FastJSONResponse)
 async def explain_retrieval(query_id: str):
     """
     **Explain how results were retrieved**
@@ -7,11 +7,12 @@ from fastapi.responses import HTMLResponse
 from typing import Optional, List
 import json
 import networkx as nx
+from app.core.responses import FastJSONResponse
 from loguru import logger
 
 router = APIRouter()
 
-@router.get("/graph-data")
+@router.get("/graph-data", response_class=FastJSONResponse)
 async def get_graph_data(
     max_nodes: int = 100,
     node_type: Optional[str] = None,
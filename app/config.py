@@ -31,10 +31,38 @@ class Settings(BaseSettings):
     gemini_api_key: Optional[str] = None
     gemini_model: str = "gemini-3-flash-preview"
 
+    # LLM client-side rate limits (unset = unlimited)
+    llm_requests_per_minute: Optional[int] = None
+    llm_tokens_per_minute: Optional[int] = None
+
+    # LLM response cache (exact prompt match)
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_seconds: int = 24 * 3600
+
+    # LLM jobs fail fast when no retrieved requirement reaches this relevance
+    llm_min_relevance: float = 0.0
+
+    # Estimated tokens of requirement text sent to the LLM per job
+    llm_context_token_budget: int = 2000
+
+    # Retrieval result cache (per graph, cleared on build/load)
+    retrieval_cache_ttl_seconds: int = 300
+    retrieval_cache_max_entries: int = 256
+
     # Database
     database_url: str = "sqlite+aiosqlite:///./knowledge_graph.db"
     graph_storage_path: str = "./graph_data"
     vector_db_path: str = "./chroma_db"
+    embedding_cache_path: str = "./embedding_cache/embeddings.db"
+
+    # Job Storage (in-process memory when no Redis URL is set)
+    redis_url: Optional[str] = None
+    job_ttl_seconds: int = 24 * 3600
+    job_max_entries: int = 10000
+
+    # Task Queue (run generation jobs on Dramatiq workers; requires redis_url)
+    task_queue_enabled: bool = False
+    task_time_limit_seconds: int = 3600
 
     # Storage Paths
     upload_dir: str = "./uploads"
@@ -49,6 +77,18 @@ class Settings(BaseSettings):
     # Embedding Model
     embedding_model: str = "all-MiniLM-L6-v2"
     embedding_dimension: int = 384
+    # Inference backend: "torch", or "onnx"/"openvino" (sentence-transformers[onnx]
+    # / [openvino]); embedding_model_file selects an exported variant, e.g.
+    # "onnx/model_qint8_avx512_vnni.onnx" for dynamic INT8 on CPU
+    embedding_backend: str = "torch"
+    embedding_model_file: Optional[str] = None
+    # CPU worker processes for encoding large graphs (0 = encode in-process)
+    embedding_pool_workers: int = 0
+    # Intra-op threads for in-process encoding (unset = torch default)
+    embedding_num_threads: Optional[int] = None
+    # Compile the torch encoder with torch.compile (slower startup; not
+    # combined with embedding_pool_workers)
+    embedding_compile: bool = False
 
     # Processing
     batch_size: int = 32
@@ -0,0 +1,74 @@
+"""
+Persistent embedding cache keyed by content hash
+"""
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_MAX_VARS = 900
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed lookup table from (model name, SHA-256 of text) to vector
+
+    Rebuilding a graph from an unchanged ingestion job hits the cache for
+    every node, so the embedding model only runs on new or edited text.
+    """
+
+    def __init__(self, db_path: str, model_name: str):
+        self.model_name = model_name
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Content hash used as the cache key"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up cached vectors, returning only the hashes that were found
+        """
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+
+        for i in range(0, len(unique), _SQLITE_MAX_VARS):
+            chunk = unique[i:i + _SQLITE_MAX_VARS]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name, *chunk]
+            )
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+        return found
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray):
+        """
+        Store vectors for the given hashes, replacing existing entries
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+            [(self.model_name, h, v.tobytes()) for h, v in zip(hashes, vectors)]
+        )
+        self.conn.commit()
+        logger.debug(f"Cached {len(hashes)} embeddings for {self.model_name}")
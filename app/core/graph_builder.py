@@ -2,15 +2,48 @@
 Knowledge Graph Builder
 Constructs multi-layer knowledge graph from JSON documents with full traceability
 """
+import gc
 import json
+import os
 import hashlib
+import heapq
+import pickle
+import orjson
 import networkx as nx
+import zstandard as zstd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import re
+import sys
+import tempfile
+from collections import Counter
 from loguru import logger
 
+from app.core.keyword_index import KeywordIndex
+
+# Frame magic of zstd streams; graphs saved before compression was added are
+# plain pickles and are still loaded as such
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Node attributes may hold numpy values or non-string dict keys
+_ORJSON_EXPORT_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Node attributes derived from others, left out of JSON exports
+_DERIVED_NODE_ATTRS = frozenset({'text_lower'})
+
+# Edge labels are repeated on every edge; intern them once so all edges share
+# the same string objects
+_ET_CONTAINS_CLAUSE = sys.intern('CONTAINS_CLAUSE')
+_ET_CONTAINS_REQ = sys.intern('CONTAINS_REQUIREMENT')
+_ET_PARENT = sys.intern('PARENT_OF')
+_ET_SIBLING = sys.intern('SIBLING_OF')
+_ET_REFS = sys.intern('REFERENCES')
+_ET_CITES = sys.intern('CITES_STANDARD')
+_LM_STRUCT = sys.intern('structural')
+_LM_REF = sys.intern('reference')
+
 class KnowledgeGraphBuilder:
     """
     Builds a traceable knowledge graph from standards documents
@@ -22,6 +55,15 @@ class KnowledgeGraphBuilder:
         self.node_count = 0
         self.edge_count = 0
         self.provenance = []
+        self._checksum: Optional[str] = None
+        self._statistics: Optional[Dict[str, Any]] = None
+        self._keyword_index: Optional[KeywordIndex] = None
+        self._requirement_nodes: Optional[List[Tuple[str, str, Optional[str]]]] = None
+
+        # Clause nodes of the graph being built, (node_id, data) in graph
+        # order, and clause_id -> node_id; shared by the linking phases
+        self._clauses: List[Tuple[str, Dict[str, Any]]] = []
+        self._clause_lookup: Dict[str, str] = {}
 
     def build_from_directory(self, data_path: str,
                             enable_structural: bool = True,
@@ -30,6 +72,10 @@ class KnowledgeGraphBuilder:
         Build knowledge graph from JSON files in directory
         """
         logger.info(f"Building knowledge graph from: {data_path}")
+        self._checksum = None
+        self._statistics = None
+        self._keyword_index = None
+        self._requirement_nodes = None
 
         data_dir = Path(data_path)
         if not data_dir.exists():
@@ -39,16 +85,19 @@ class KnowledgeGraphBuilder:
         json_files = sorted(list(data_dir.rglob("*.json")))
         logger.info(f"Found {len(json_files)} JSON files")
 
-        documents = []
-        for json_file in json_files:
+        def load_one(json_file: Path) -> Optional[Dict[str, Any]]:
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    data['_source_file'] = str(json_file.relative_to(data_dir))
-                    documents.append(data)
+                data = orjson.loads(json_file.read_bytes())
+                data['_source_file'] = str(json_file.relative_to(data_dir))
+                return data
             except Exception as e:
                 logger.warning(f"Failed to load {json_file}: {e}")
-                continue
+                return None
+
+        # Reads overlap on a thread pool; map() keeps the sorted file order
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            documents = [data for data in executor.map(load_one, json_files) if data is not None]
 
         logger.info(f"Loaded {len(documents)} documents successfully")
 
@@ -77,16 +126,23 @@ class KnowledgeGraphBuilder:
             'standards': stats['standards'],
             'clauses': stats['clauses'],
             'requirements': stats['requirements'],
-            'graph_checksum': self._compute_checksum()
+            'graph_checksum': self.get_checksum()
         }
 
     def _create_nodes(self, documents: List[Dict[str, Any]]):
         """
         Create nodes for all entities in documents
         """
+        # Everything created in one build phase shares a timestamp
+        created_at = datetime.utcnow().isoformat()
+
         # Track standards
         standards = {}
 
+        # Nodes and edges are staged locally and inserted in bulk
+        nodes = []
+        edges = []
+
         for doc in documents:
             chunk_id = doc.get('chunk_id', '')
             document_id = doc.get('document_id', '')
@@ -100,10 +156,9 @@ class KnowledgeGraphBuilder:
                     'node_type': 'Standard',
                     'document_id': document_id,
                     'title': document_id,
-                    'created_at': datetime.utcnow().isoformat()
+                    'created_at': created_at
                 }
-                self.graph.add_node(document_id, **standards[document_id])
-                self.node_count += 1
+                nodes.append((document_id, standards[document_id]))
 
             # Create clause node
             clause_node = {
@@ -119,7 +174,7 @@ class KnowledgeGraphBuilder:
                 'figures': doc.get('figures', []),
                 'references': doc.get('references', {}),
                 'source_file': doc.get('_source_file', ''),
-                'created_at': datetime.utcnow().isoformat()
+                'created_at': created_at
             }
 
             # Calculate depth from clause_id
@@ -130,19 +185,15 @@ class KnowledgeGraphBuilder:
             else:
                 clause_node['depth'] = 0
 
-            self.graph.add_node(chunk_id, **clause_node)
-            self.node_count += 1
+            nodes.append((chunk_id, clause_node))
 
             # Add edge: Standard -> Clause
-            self.graph.add_edge(
-                document_id,
-                chunk_id,
-                edge_type='CONTAINS_CLAUSE',
-                linking_method='structural',
-                confidence=1.0,
-                created_at=datetime.utcnow().isoformat()
-            )
-            self.edge_count += 1
+            edges.append((document_id, chunk_id, {
+                'edge_type': _ET_CONTAINS_CLAUSE,
+                'linking_method': _LM_STRUCT,
+                'confidence': 1.0,
+                'created_at': created_at
+            }))
 
             # Create requirement nodes
             requirements = doc.get('requirements', [])
@@ -156,99 +207,117 @@ class KnowledgeGraphBuilder:
                     'requirement_type': req.get('type', 'unknown'),
                     'keyword': req.get('keyword', ''),
                     'text': req.get('text', ''),
-                    'created_at': datetime.utcnow().isoformat()
+                    'text_lower': req.get('text', '').lower(),  # For keyword matching
+                    'created_at': created_at
                 }
 
-                self.graph.add_node(req_id, **req_node)
-                self.node_count += 1
+                nodes.append((req_id, req_node))
 
                 # Add edge: Clause -> Requirement
-                self.graph.add_edge(
-                    chunk_id,
-                    req_id,
-                    edge_type='CONTAINS_REQUIREMENT',
-                    linking_method='structural',
-                    confidence=1.0,
-                    created_at=datetime.utcnow().isoformat()
-                )
-                self.edge_count += 1
+                edges.append((chunk_id, req_id, {
+                    'edge_type': _ET_CONTAINS_REQ,
+                    'linking_method': _LM_STRUCT,
+                    'confidence': 1.0,
+                    'created_at': created_at
+                }))
+
+        self.graph.add_nodes_from(nodes)
+        self.graph.add_edges_from(edges)
+        self.node_count += len(nodes)
+        self.edge_count += len(edges)
+
+        # Index clauses once for the structural and reference phases
+        self._clauses = [
+            (node_id, data) for node_id, data in self.graph.nodes(data=True)
+            if data.get('node_type') == 'Clause'
+        ]
+        self._clause_lookup = {}
+        for node_id, data in self._clauses:
+            clause_id = data.get('clause_id')
+            if clause_id:
+                self._clause_lookup[clause_id] = node_id
 
     def _create_structural_links(self):
         """
         Create parent-child hierarchical links
         """
-        # Build lookup by clause_id
-        clause_lookup = {}
-        for node_id, data in self.graph.nodes(data=True):
-            if data.get('node_type') == 'Clause':
-                clause_id = data.get('clause_id')
-                if clause_id:
-                    clause_lookup[clause_id] = node_id
+        # Everything created in one build phase shares a timestamp
+        created_at = datetime.utcnow().isoformat()
 
-        # Create parent-child edges
-        for node_id, data in self.graph.nodes(data=True):
-            if data.get('node_type') != 'Clause':
-                continue
+        clause_lookup = self._clause_lookup
 
+        edges = []
+        # (source, target) pairs staged so far, for the sibling existence check
+        linked = set()
+        # Per-parent (ordered unique children, children set), resolved once per parent
+        parent_children = {}
+
+        # Create parent-child edges
+        for node_id, data in self._clauses:
             parent_id = data.get('parent_id')
-            if parent_id and parent_id in clause_lookup:
-                parent_node_id = clause_lookup[parent_id]
+            parent_node_id = clause_lookup.get(parent_id) if parent_id else None
+            if parent_node_id is None:
+                continue
 
-                # Add parent-child edges
-                self.graph.add_edge(
-                    parent_node_id,
-                    node_id,
-                    edge_type='PARENT_OF',
-                    linking_method='structural',
-                    confidence=1.0,
-                    created_at=datetime.utcnow().isoformat()
-                )
-                self.edge_count += 1
+            # Add parent-child edges
+            edges.append((parent_node_id, node_id, {
+                'edge_type': _ET_PARENT,
+                'linking_method': _LM_STRUCT,
+                'confidence': 1.0,
+                'created_at': created_at
+            }))
+            linked.add((parent_node_id, node_id))
+            self.edge_count += 1
 
             # Add sibling relationships
-            if parent_id and parent_id in clause_lookup:
-                parent_node_id = clause_lookup[parent_id]
-                parent_data = self.graph.nodes[parent_node_id]
-                children = parent_data.get('children_ids', [])
-
-                clause_id = data.get('clause_id')
-                if clause_id in children:
-                    for sibling_id in children:
-                        if sibling_id != clause_id and sibling_id in clause_lookup:
-                            sibling_node_id = clause_lookup[sibling_id]
-
-                            # Check if edge already exists
-                            if not self.graph.has_edge(node_id, sibling_node_id, key=0):
-                                self.graph.add_edge(
-                                    node_id,
-                                    sibling_node_id,
-                                    edge_type='SIBLING_OF',
-                                    linking_method='structural',
-                                    confidence=1.0,
-                                    created_at=datetime.utcnow().isoformat()
-                                )
-                                self.edge_count += 1
+            if parent_node_id not in parent_children:
+                children = self.graph.nodes[parent_node_id].get('children_ids', [])
+                # Only children that resolve to a clause can become siblings
+                ordered = [c for c in dict.fromkeys(children) if c in clause_lookup]
+                parent_children[parent_node_id] = (ordered, set(children))
+            siblings, children_set = parent_children[parent_node_id]
+
+            # A single resolvable child has no siblings to link
+            clause_id = data.get('clause_id')
+            if len(siblings) < 2 or clause_id not in children_set:
+                continue
+
+            has_edge = self.graph.has_edge
+            for sibling_id in siblings:
+                if sibling_id == clause_id:
+                    continue
+                sibling_node_id = clause_lookup[sibling_id]
+
+                # Check if edge already exists
+                pair = (node_id, sibling_node_id)
+                if pair not in linked and not has_edge(node_id, sibling_node_id, key=0):
+                    edges.append((node_id, sibling_node_id, {
+                        'edge_type': _ET_SIBLING,
+                        'linking_method': _LM_STRUCT,
+                        'confidence': 1.0,
+                        'created_at': created_at
+                    }))
+                    linked.add(pair)
+                    self.edge_count += 1
+
+        self.graph.add_edges_from(edges)
 
     def _create_reference_links(self):
         """
         Create reference-based links from internal_resolved and standards
         """
-        # Build lookup by clause_id
-        clause_lookup = {}
-        for node_id, data in self.graph.nodes(data=True):
-            if data.get('node_type') == 'Clause':
-                clause_id = data.get('clause_id')
-                if clause_id:
-                    clause_lookup[clause_id] = node_id
-
-        # Create reference edges
-        # First, collect all nodes to avoid dictionary changed size during iteration
-        nodes_list = list(self.graph.nodes(data=True))
-
-        for node_id, data in nodes_list:
-            if data.get('node_type') != 'Clause':
-                continue
+        # Everything created in one build phase shares a timestamp
+        created_at = datetime.utcnow().isoformat()
+
+        clause_lookup = self._clause_lookup
 
+        nodes = []
+        new_node_ids = set()
+        edges = []
+
+        # Create reference edges (external standard nodes are only added
+        # after the loop, so the clause list is stable)
+        for node_id, data in self._clauses:
             references = data.get('references', {})
 
             # Internal references
@@ -257,14 +326,12 @@ class KnowledgeGraphBuilder:
                 if ref_clause_id in clause_lookup:
                     ref_node_id = clause_lookup[ref_clause_id]
 
-                    self.graph.add_edge(
-                        node_id,
-                        ref_node_id,
-                        edge_type='REFERENCES',
-                        linking_method='reference',
-                        confidence=1.0,
-                        created_at=datetime.utcnow().isoformat()
-                    )
+                    edges.append((node_id, ref_node_id, {
+                        'edge_type': _ET_REFS,
+                        'linking_method': _LM_REF,
+                        'confidence': 1.0,
+                        'created_at': created_at
+                    }))
                     self.edge_count += 1
 
             # Cross-standard references
@@ -272,63 +339,100 @@ class KnowledgeGraphBuilder:
             for std_ref in std_refs:
                 # Create external standard node if needed
                 std_node_id = f"EXT::{std_ref}"
-                if not self.graph.has_node(std_node_id):
-                    self.graph.add_node(
-                        std_node_id,
-                        node_type='ExternalStandard',
-                        standard_name=std_ref,
-                        created_at=datetime.utcnow().isoformat()
-                    )
+                if std_node_id not in new_node_ids and not self.graph.has_node(std_node_id):
+                    nodes.append((std_node_id, {
+                        'node_type': 'ExternalStandard',
+                        'standard_name': std_ref,
+                        'created_at': created_at
+                    }))
+                    new_node_ids.add(std_node_id)
                     self.node_count += 1
 
-                self.graph.add_edge(
-                    node_id,
-                    std_node_id,
-                    edge_type='CITES_STANDARD',
-                    linking_method='reference',
-                    confidence=1.0,
-                    created_at=datetime.utcnow().isoformat()
-                )
+                edges.append((node_id, std_node_id, {
+                    'edge_type': _ET_CITES,
+                    'linking_method': _LM_REF,
+                    'confidence': 1.0,
+                    'created_at': created_at
+                }))
                 self.edge_count += 1
 
+        self.graph.add_nodes_from(nodes)
+        self.graph.add_edges_from(edges)
+
     def _compute_statistics(self) -> Dict[str, Any]:
         """
         Compute graph statistics
         """
-        stats = {
+        if self._statistics is None:
+            self._scan_graph()
+        return dict(self._statistics)
+
+    def _scan_graph(self):
+        """
+        Count node types and compute the checksum in a single pass over the nodes
+        """
+        type_counts = Counter()
+
+        def node_ids():
+            for node_id, node_type in self.graph.nodes(data='node_type', default=''):
+                type_counts[node_type] += 1
+                yield node_id
+
+        sample_ids = heapq.nsmallest(10, node_ids())
+
+        self._statistics = {
             'nodes': self.graph.number_of_nodes(),
             'edges': self.graph.number_of_edges(),
-            'standards': 0,
-            'clauses': 0,
-            'requirements': 0,
-            'external_standards': 0
+            'standards': type_counts['Standard'],
+            'clauses': type_counts['Clause'],
+            'requirements': type_counts['Requirement'],
+            'external_standards': type_counts['ExternalStandard']
         }
+        self._checksum = self._compute_checksum(sample_ids)
+
+    def get_checksum(self) -> str:
+        """
+        Get the graph checksum, computing it only once per built/loaded graph
+        """
+        if self._checksum is None:
+            self._scan_graph()
+        return self._checksum
 
-        for node_id, data in self.graph.nodes(data=True):
-            node_type = data.get('node_type', '')
-            if node_type == 'Standard':
-                stats['standards'] += 1
-            elif node_type == 'Clause':
-                stats['clauses'] += 1
-            elif node_type == 'Requirement':
-                stats['requirements'] += 1
-            elif node_type == 'ExternalStandard':
-                stats['external_standards'] += 1
+    def get_requirement_nodes(self) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Get all Requirement nodes as (node_id, lowercased text, requirement_type)
 
-        return stats
+        Built once per built/loaded graph, in graph order.
+        """
+        if self._requirement_nodes is None:
+            self._requirement_nodes = [
+                (
+                    node_id,
+                    # Graphs saved before text_lower was stored lack it
+                    node_data.get('text_lower') or node_data.get('text', '').lower(),
+                    node_data.get('requirement_type')
+                )
+                for node_id, node_data in self.graph.nodes(data=True)
+                if node_data.get('node_type') == 'Requirement'
+            ]
+        return self._requirement_nodes
 
-    def _compute_checksum(self) -> str:
+    def get_keyword_index(self) -> KeywordIndex:
         """
-        Compute deterministic checksum of graph
+        Get the inverted index of requirement text, built once per built/loaded graph
         """
-        nodes = sorted(self.graph.nodes(data=True), key=lambda x: x[0])
-        edges = sorted(self.graph.edges(data=True, keys=True),
-                      key=lambda x: (x[0], x[1], x[2]))
+        if self._keyword_index is None:
+            self._keyword_index = KeywordIndex.from_requirements(self.get_requirement_nodes())
+        return self._keyword_index
 
+    def _compute_checksum(self, sample_ids: List[str]) -> str:
+        """
+        Compute deterministic checksum of graph from its 10 smallest node ids
+        """
         graph_repr = {
-            'nodes': len(nodes),
-            'edges': len(edges),
-            'node_ids': [n[0] for n in nodes[:10]]  # Sample
+            'nodes': self.graph.number_of_nodes(),
+            'edges': self.graph.number_of_edges(),
+            'node_ids': sample_ids  # Sample
         }
 
         canonical = json.dumps(graph_repr, sort_keys=True)
@@ -336,25 +440,42 @@ class KnowledgeGraphBuilder:
 
     def save_graph(self, output_path: str):
         """
-        Save graph to file
+        Save graph to file as a zstd-compressed pickle
         """
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
-        # Save as pickle for fast loading
-        import pickle
+        cctx = zstd.ZstdCompressor(level=3, threads=-1)
         with open(output_path, 'wb') as f:
-            pickle.dump(self.graph, f)
+            with cctx.stream_writer(f, closefd=False) as writer:
+                pickle.dump(self.graph, writer, protocol=pickle.HIGHEST_PROTOCOL)
 
         logger.info(f"Graph saved to: {output_path}")
 
     def load_graph(self, input_path: str):
         """
-        Load graph from file
+        Load graph from file (compressed or legacy plain pickle)
         """
-        import pickle
-        with open(input_path, 'rb') as f:
-            self.graph = pickle.load(f)
-
+        # Unpickling allocates one container per node/edge attribute dict;
+        # pausing the cyclic GC avoids repeated collections over them
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(input_path, 'rb') as f:
+                if f.read(4) == _ZSTD_MAGIC:
+                    f.seek(0)
+                    with zstd.ZstdDecompressor().stream_reader(f) as reader:
+                        self.graph = pickle.load(reader)
+                else:
+                    f.seek(0)
+                    self.graph = pickle.load(f)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        self._checksum = None
+        self._statistics = None
+        self._keyword_index = None
+        self._requirement_nodes = None
         self.node_count = self.graph.number_of_nodes()
         self.edge_count = self.graph.number_of_edges()
 
@@ -369,24 +490,46 @@ class KnowledgeGraphBuilder:
     def export_json(self, output_path: str):
         """
         Export graph as JSON for external analysis
+
+        Nodes and edges are streamed one record at a time so the whole
+        document is never held in memory at once. They are written to a
+        temporary file that replaces output_path only once complete, so
+        readers never see a partial export.
         """
-        graph_data = {
-            'nodes': [
-                {'id': n, **self.graph.nodes[n]}
-                for n in self.graph.nodes()
-            ],
-            'edges': [
-                {'source': u, 'target': v, 'key': k, **data}
-                for u, v, k, data in self.graph.edges(data=True, keys=True)
-            ],
-            'metadata': {
-                'created_at': datetime.utcnow().isoformat(),
-                'statistics': self._compute_statistics(),
-                'checksum': self._compute_checksum()
-            }
+        metadata = {
+            'created_at': datetime.utcnow().isoformat(),
+            'statistics': self._compute_statistics(),
+            'checksum': self.get_checksum()
         }
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(graph_data, f, indent=2)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb', buffering=1 << 22) as f:
+                f.write(b'{"nodes":[')
+                first = True
+                for n, data in self.graph.nodes(data=True):
+                    if not first:
+                        f.write(b',')
+                    first = False
+                    if _DERIVED_NODE_ATTRS.intersection(data):
+                        data = {key: value for key, value in data.items() if key not in _DERIVED_NODE_ATTRS}
+                    f.write(orjson.dumps({'id': n, **data}, option=_ORJSON_EXPORT_OPTIONS))
+
+                f.write(b'],"edges":[')
+                first = True
+                for u, v, k, data in self.graph.edges(data=True, keys=True):
+                    if not first:
+                        f.write(b',')
+                    first = False
+                    f.write(orjson.dumps({'source': u, 'target': v, 'key': k, **data},
+                                         option=_ORJSON_EXPORT_OPTIONS))
+
+                f.write(b'],"metadata":')
+                f.write(orjson.dumps(metadata, option=_ORJSON_EXPORT_OPTIONS))
+                f.write(b'}')
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
 
         logger.info(f"Graph exported to JSON: {output_path}")
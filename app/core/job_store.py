@@ -0,0 +1,335 @@
+"""
+Job state storage for background processing endpoints
+"""
+import asyncio
+import contextlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from loguru import logger
+
+from app.config import settings
+
+# Fields holding datetimes, restored from their ISO form when read from Redis
+_DATETIME_FIELDS = ('created_at',)
+
+# Job statuses after which a job no longer changes
+_TERMINAL_STATUSES = ('completed', 'failed')
+
+# Seconds between job state reads while a status request on a plain dict
+# of jobs is held open
+_WAIT_POLL_INTERVAL = 0.2
+
+# Upper bound on the wait for a change notification before a JobStore job
+# is re-read anyway (e.g. when it expired without an update)
+_WAIT_RECHECK_INTERVAL = 1.0
+
+
+class JobStore:
+    """
+    Stores job state dictionaries keyed by job ID
+
+    When settings.redis_url is configured, jobs are kept in Redis hashes so
+    that state is shared across workers and survives restarts. Otherwise jobs
+    live in process memory.
+
+    The public methods are coroutines: Redis round-trips run on a worker
+    thread so they never block the event loop, while in-memory operations
+    run inline. Every create or update notifies the callers watching that
+    job, in process or through Redis pub/sub.
+
+    Jobs expire ttl seconds after they were last created or updated, and the
+    least recently updated jobs are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, namespace: str, ttl: Optional[int] = None,
+                 max_entries: Optional[int] = None):
+        self.namespace = namespace
+        self.ttl = ttl if ttl is not None else settings.job_ttl_seconds
+        self.max_entries = max_entries if max_entries is not None else settings.job_max_entries
+
+        # job_id -> (expires_at, job), least recently updated first
+        self._jobs: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._redis = None
+
+        # job_id -> events of in-process watchers, with their event loops
+        self._watchers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._watchers_lock = threading.Lock()
+        # Async Redis clients for pub/sub, one per event loop
+        self._async_redis: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+        if settings.redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(settings.redis_url)
+            logger.info(f"Job store '{namespace}' backed by Redis")
+
+    @property
+    def _index_key(self) -> str:
+        return f"{self.namespace}:index"
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.namespace}:{job_id}"
+
+    def _channel(self, job_id: str) -> str:
+        return f"{self.namespace}:changed:{job_id}"
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, bytes]:
+        return {name: orjson.dumps(value) for name, value in fields.items()}
+
+    @staticmethod
+    def _decode(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+        job = {name.decode(): orjson.loads(value) for name, value in raw.items()}
+        for name in _DATETIME_FIELDS:
+            if isinstance(job.get(name), str):
+                job[name] = datetime.fromisoformat(job[name])
+        return job
+
+    async def _run(self, operation: Callable, *args):
+        """
+        Run a store operation, off the event loop when it talks to Redis
+        """
+        if self._redis is None:
+            return operation(*args)
+        return await asyncio.to_thread(operation, *args)
+
+    def _evict(self):
+        """
+        Drop expired jobs and trim the store to max_entries
+        """
+        now = time.time()
+
+        if self._redis is None:
+            while self._jobs:
+                job_id, (expires_at, _) = next(iter(self._jobs.items()))
+                if expires_at > now and len(self._jobs) <= self.max_entries:
+                    break
+                del self._jobs[job_id]
+            return
+
+        self._redis.zremrangebyscore(self._index_key, '-inf', now - self.ttl)
+        overflow = self._redis.zcard(self._index_key) - self.max_entries
+        if overflow > 0:
+            evicted = [raw_id.decode() for raw_id, _ in self._redis.zpopmin(self._index_key, overflow)]
+            self._redis.delete(*(self._key(job_id) for job_id in evicted))
+
+    async def create(self, job_id: str, /, **fields):
+        """
+        Register a new job with its initial state
+        """
+        await self._run(self._create, job_id, fields)
+
+    async def update(self, job_id: str, /, **fields):
+        """
+        Update fields of an existing job and refresh its expiry
+        """
+        await self._run(self._update, job_id, fields)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the state of a job, or None if it does not exist or has expired
+        """
+        return await self._run(self._get, job_id)
+
+    async def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Get live (job_id, job) pairs, least recently updated first
+        """
+        return await self._run(self._items)
+
+    async def count(self) -> int:
+        """
+        Number of live jobs
+        """
+        return await self._run(self._count)
+
+    @contextlib.asynccontextmanager
+    async def watch(self, job_id: str) -> AsyncIterator[Callable[[float], Awaitable[None]]]:
+        """
+        Subscribe to changes of a job
+
+        Yields a coroutine function that waits at most timeout seconds for
+        the next create or update of the job. Changes made after entering
+        the context are never missed, so read the job inside it.
+        """
+        if self._redis is None:
+            loop = asyncio.get_running_loop()
+            watcher = (loop, asyncio.Event())
+            with self._watchers_lock:
+                self._watchers.setdefault(job_id, []).append(watcher)
+
+            async def changed(timeout: float):
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(watcher[1].wait(), timeout)
+                watcher[1].clear()
+
+            try:
+                yield changed
+            finally:
+                with self._watchers_lock:
+                    watchers = self._watchers.get(job_id, [])
+                    watchers.remove(watcher)
+                    if not watchers:
+                        self._watchers.pop(job_id, None)
+            return
+
+        pubsub = self._pubsub_client().pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._channel(job_id))
+
+        async def changed(timeout: float):
+            await pubsub.get_message(timeout=timeout)
+
+        try:
+            yield changed
+        finally:
+            await pubsub.aclose()
+
+    def _pubsub_client(self):
+        """Async Redis client bound to the running event loop"""
+        import redis.asyncio
+
+        loop = asyncio.get_running_loop()
+        client = self._async_redis.get(loop)
+        if client is None:
+            client = redis.asyncio.Redis.from_url(settings.redis_url)
+            self._async_redis[loop] = client
+        return client
+
+    def _notify(self, job_id: str):
+        """Wake the in-process watchers of a job"""
+        with self._watchers_lock:
+            watchers = list(self._watchers.get(job_id, ()))
+        for loop, event in watchers:
+            with contextlib.suppress(RuntimeError):  # loop already closed
+                loop.call_soon_threadsafe(event.set)
+
+    def _create(self, job_id: str, fields: Dict[str, Any]):
+        if self._redis is None:
+            self._jobs.pop(job_id, None)
+            self._jobs[job_id] = (time.time() + self.ttl, dict(fields))
+            self._evict()
+            self._notify(job_id)
+            return
+
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key(job_id))
+        pipe.hset(self._key(job_id), mapping=self._encode(fields))
+        pipe.expire(self._key(job_id), self.ttl)
+        pipe.zadd(self._index_key, {job_id: time.time()})
+        pipe.publish(self._channel(job_id), b'')
+        pipe.execute()
+        self._evict()
+
+    def _update(self, job_id: str, fields: Dict[str, Any]):
+        if self._redis is None:
+            entry = self._jobs.pop(job_id, None)
+            if entry is None:
+                logger.warning(f"Job {job_id} was evicted from '{self.namespace}' before update")
+                return
+            job = entry[1]
+            job.update(fields)
+            self._jobs[job_id] = (time.time() + self.ttl, job)
+            self._notify(job_id)
+            return
+
+        key = self._key(job_id)
+
+        # Only touch jobs that still exist, so an expired job is not
+        # recreated as a partial hash without its status
+        def apply(pipe) -> bool:
+            if not pipe.exists(key):
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping=self._encode(fields))
+            pipe.expire(key, self.ttl)
+            pipe.zadd(self._index_key, {job_id: time.time()})
+            pipe.publish(self._channel(job_id), b'')
+            return True
+
+        if not self._redis.transaction(apply, key, value_from_callable=True):
+            logger.warning(f"Job {job_id} was evicted from '{self.namespace}' before update")
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self._redis is None:
+            entry = self._jobs.get(job_id)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return entry[1]
+
+        raw = self._redis.hgetall(self._key(job_id))
+        return self._decode(raw) if raw else None
+
+    def _items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        self._evict()
+
+        if self._redis is None:
+            return [(job_id, job) for job_id, (_, job) in self._jobs.items()]
+
+        items = []
+        for raw_id in self._redis.zrange(self._index_key, 0, -1):
+            job_id = raw_id.decode()
+            job = self._get(job_id)
+            if job is not None:
+                items.append((job_id, job))
+        return items
+
+    def _count(self) -> int:
+        self._evict()
+        if self._redis is None:
+            return len(self._jobs)
+        return self._redis.zcard(self._index_key)
+
+
+async def wait_for_job(jobs, job_id: str, timeout: float,
+                       since_status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Long-poll a job held in a JobStore (or a plain dict of jobs)
+
+    Returns the job state as soon as the job finishes or, when since_status
+    is given, as soon as its status differs from it. Otherwise returns the
+    latest state once timeout seconds have passed. Returns None if the job
+    does not exist.
+
+    JobStore jobs are re-read when the store reports a change; a plain dict
+    is polled.
+    """
+    def settled(job: Optional[Dict[str, Any]]) -> bool:
+        if job is None:
+            return True
+        status = job['status']
+        return status in _TERMINAL_STATUSES or (since_status is not None and status != since_status)
+
+    deadline = time.monotonic() + timeout
+
+    if not isinstance(jobs, JobStore):
+        job = jobs.get(job_id)
+        while not settled(job):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(_WAIT_POLL_INTERVAL, remaining))
+            job = jobs.get(job_id)
+        return job
+
+    job = await jobs.get(job_id)
+    if settled(job) or timeout <= 0:
+        return job
+
+    async with jobs.watch(job_id) as changed:
+        # Re-read once subscribed so a change in between is not missed
+        job = await jobs.get(job_id)
+        while not settled(job):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await changed(min(_WAIT_RECHECK_INTERVAL, remaining))
+            job = await jobs.get(job_id)
+
+    return job
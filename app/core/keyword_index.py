@@ -0,0 +1,117 @@
+"""
+Inverted index for keyword matching over requirement text
+"""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Index tokens: runs of lowercase letters, digits and the degree sign
+# (so values like "85°c" stay one token)
+TOKEN_PATTERN = re.compile(r"[a-z0-9°]+")
+
+
+class KeywordIndex:
+    """
+    Maps tokens of lowercased requirement text to the requirements containing them
+
+    Requirements are numbered by row in the order they were indexed (graph
+    order). Lookups keep the substring semantics of `term in text`: a term
+    matches every requirement with a token containing it (e.g. "therm"
+    matches "thermal"), and terms spanning several tokens are verified
+    against the text of the candidates.
+    """
+
+    def __init__(self):
+        self.node_ids: List[str] = []
+        self.texts: List[str] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self._mandatory: List[bool] = []
+        self._mandatory_array: Optional[np.ndarray] = None
+        self._fragment_cache: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_requirements(cls, requirements: Iterable[Tuple[str, str, Optional[str]]]) -> "KeywordIndex":
+        """
+        Index (node_id, lowercased text, requirement_type) tuples, skipping empty text
+        """
+        index = cls()
+        for node_id, text, requirement_type in requirements:
+            if text:
+                index.add(node_id, text, mandatory=requirement_type == 'mandatory')
+        return index
+
+    def add(self, node_id: str, text: str, mandatory: bool = False):
+        """
+        Index one requirement by its lowercased text
+        """
+        row = len(self.node_ids)
+        self.node_ids.append(node_id)
+        self.texts.append(text)
+        self._mandatory.append(mandatory)
+        for token in dict.fromkeys(TOKEN_PATTERN.findall(text)):
+            self.postings[token].append(row)
+
+        self._mandatory_array = None
+        self._fragment_cache.clear()
+
+    @property
+    def mandatory(self) -> np.ndarray:
+        """Per-row flag for mandatory requirements"""
+        if self._mandatory_array is None:
+            self._mandatory_array = np.array(self._mandatory, dtype=bool)
+        return self._mandatory_array
+
+    def _fragment_rows(self, fragment: str) -> np.ndarray:
+        # Rows with a token containing the fragment
+        if fragment not in self._fragment_cache:
+            rows = [
+                np.asarray(token_rows, dtype=np.int64)
+                for token, token_rows in self.postings.items()
+                if fragment in token
+            ]
+            self._fragment_cache[fragment] = (
+                np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+            )
+        return self._fragment_cache[fragment]
+
+    def lookup_rows(self, term: str) -> np.ndarray:
+        """
+        Get the rows of requirements whose text contains the (lowercase) term
+        """
+        fragments = TOKEN_PATTERN.findall(term)
+        if not fragments:
+            return np.array([row for row, text in enumerate(self.texts) if term in text], dtype=np.int64)
+
+        if fragments == [term]:
+            return self._fragment_rows(term)
+
+        candidates = self._fragment_rows(fragments[0])
+        for fragment in fragments[1:]:
+            candidates = np.intersect1d(candidates, self._fragment_rows(fragment), assume_unique=True)
+        return np.array([row for row in candidates if term in self.texts[row]], dtype=np.int64)
+
+    def match_rows(self, terms: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the requirements matching any term
+
+        Returns the matching rows in graph order and, for each of them, a
+        boolean mask over terms marking which terms it contains.
+        """
+        hits = np.zeros((len(self.node_ids), len(terms)), dtype=bool)
+        for column, term in enumerate(terms):
+            hits[self.lookup_rows(term), column] = True
+
+        rows = np.flatnonzero(hits.any(axis=1))
+        return rows, hits[rows]
+
+    def match(self, terms: Sequence[str]) -> Dict[str, List[str]]:
+        """
+        Map each matching requirement to its matched terms, in term order
+        """
+        rows, term_mask = self.match_rows(terms)
+        return {
+            self.node_ids[row]: [terms[column] for column in np.flatnonzero(mask)]
+            for row, mask in zip(rows, term_mask)
+        }
@@ -0,0 +1,87 @@
+"""
+Exact-match cache for LLM responses
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from loguru import logger
+
+from app.config import settings
+
+
+class LLMResponseCache:
+    """
+    Caches raw LLM completions keyed by SHA-256 of (prompt, model, temperature)
+
+    Uses Redis with a TTL when settings.redis_url is configured, otherwise a
+    bounded in-process LRU with the same TTL. Redis round-trips run on a
+    worker thread so they never block the event loop.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_entries: int = 512):
+        self.ttl = ttl if ttl is not None else settings.llm_cache_ttl_seconds
+        self.max_entries = max_entries
+
+        # key -> (expires_at, content), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._redis = None
+
+        if settings.redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(settings.redis_url)
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float) -> str:
+        """Cache key for a completion request"""
+        payload = f"{model}\x00{temperature}\x00{prompt}".encode('utf-8')
+        return f"llm:{hashlib.sha256(payload).hexdigest()}"
+
+    async def _run(self, operation: Callable, *args):
+        """
+        Run a cache operation, off the event loop when it talks to Redis
+        """
+        if self._redis is None:
+            return operation(*args)
+        return await asyncio.to_thread(operation, *args)
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get a cached completion, or None on a miss
+        """
+        return await self._run(self._get, key)
+
+    async def put(self, key: str, content: str):
+        """
+        Store a completion
+        """
+        if not content:
+            return
+        await self._run(self._put, key, content)
+
+    def _get(self, key: str) -> Optional[str]:
+        if self._redis is not None:
+            content = self._redis.get(key)
+            return content.decode('utf-8') if content is not None else None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: str, content: str):
+        if self._redis is not None:
+            self._redis.setex(key, self.ttl, content.encode('utf-8'))
+            return
+
+        self._entries[key] = (time.time() + self.ttl, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.debug(f"Cached LLM response {key}")
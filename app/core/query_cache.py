@@ -0,0 +1,95 @@
+"""
+Similarity-based cache for semantic search results
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+
+class SimilarityQueryCache:
+    """
+    Caches search results by query text and by query embedding
+
+    A lookup first tries an exact hash of the query text, then falls back
+    to the most similar cached query embedding. Results are reused when the
+    cosine similarity reaches the threshold. Embeddings must be normalized.
+    Methods are thread-safe, as searches run on worker threads.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.95, max_entries: int = 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self._exact: "OrderedDict[str, int]" = OrderedDict()
+        self._embeddings = np.empty((0, dim), dtype=np.float32)
+        self._scopes: list = []
+        self._results: list = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(scope: str, query: str) -> str:
+        return hashlib.sha256(f"{scope}\x00{query}".encode('utf-8')).hexdigest()
+
+    def get_exact(self, scope: str, query: str) -> Optional[Any]:
+        """
+        Look up a result by exact query text
+        """
+        key = self._hash(scope, query)
+        with self._lock:
+            slot = self._exact.get(key)
+            return None if slot is None else self._results[slot]
+
+    def get_similar(self, scope: str, query_embedding: np.ndarray) -> Optional[Any]:
+        """
+        Look up a result for the nearest cached query in the same scope
+        """
+        with self._lock:
+            if not self._results:
+                return None
+
+            scores = self._embeddings @ np.asarray(query_embedding, dtype=np.float32)
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                if self._scopes[slot] == scope:
+                    return self._results[slot]
+
+        return None
+
+    def put(self, scope: str, query: str, query_embedding: np.ndarray, result: Any):
+        """
+        Store a result, evicting the oldest entry when full
+        """
+        key = self._hash(scope, query)
+        with self._lock:
+            if len(self._results) >= self.max_entries:
+                self._evict_oldest()
+
+            self._exact[key] = len(self._results)
+            self._embeddings = np.vstack([
+                self._embeddings,
+                np.asarray(query_embedding, dtype=np.float32)[None, :]
+            ])
+            self._scopes.append(scope)
+            self._results.append(result)
+
+    def _evict_oldest(self):
+        self._embeddings = self._embeddings[1:]
+        self._scopes.pop(0)
+        self._results.pop(0)
+        self._exact = OrderedDict(
+            (key, slot - 1) for key, slot in self._exact.items() if slot > 0
+        )
+
+    def clear(self):
+        """
+        Drop all cached results (e.g. after re-indexing)
+        """
+        with self._lock:
+            self._exact.clear()
+            self._embeddings = self._embeddings[:0]
+            self._scopes.clear()
+            self._results.clear()
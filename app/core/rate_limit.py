@@ -0,0 +1,102 @@
+"""
+Client-side rate limiting for external LLM APIs
+"""
+import asyncio
+import threading
+import time
+import weakref
+from typing import Optional
+
+
+class AsyncTokenBucket:
+    """
+    Async token bucket enforcing requests-per-minute and tokens-per-minute
+
+    Callers reserve an estimated token count before each request and refund
+    the unused part once the real usage is known. Either limit may be None
+    to leave it unbounded.
+
+    One bucket can be shared by several threads, each running its own event
+    loop (e.g. dramatiq worker threads): the budget is guarded by a thread
+    lock, and waiters queue on a separate asyncio lock per event loop.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._state_lock = threading.Lock()
+        self._loop_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _waiters_lock(self) -> asyncio.Lock:
+        """Lock ordering the waiters on the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._state_lock:
+            lock = self._loop_locks.get(loop)
+            if lock is None:
+                lock = self._loop_locks[loop] = asyncio.Lock()
+        return lock
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60
+            )
+
+    def _wait_time(self, tokens: int) -> float:
+        """Seconds until both budgets can cover one request of this size"""
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.requests_per_minute
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> int:
+        """
+        Wait until a request of the estimated size fits the limits
+
+        Returns the number of tokens reserved.
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        else:
+            tokens = 0
+
+        # Waiters on one event loop are served in arrival order
+        async with self._waiters_lock():
+            while True:
+                with self._state_lock:
+                    self._refill()
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        if self.requests_per_minute:
+                            self._requests -= 1
+                        self._tokens -= tokens
+                        return tokens
+                await asyncio.sleep(wait)
+
+    def refund(self, tokens: int):
+        """
+        Return reserved tokens that the request did not use
+        """
+        if tokens > 0 and self.tokens_per_minute:
+            with self._state_lock:
+                self._refill()
+                self._tokens = min(self.tokens_per_minute, self._tokens + tokens)
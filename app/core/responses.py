@@ -0,0 +1,22 @@
+"""
+Response classes shared by the API routers
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson
+
+    Used for endpoints returning free-form dicts. Endpoints with a
+    response_model are already serialized directly by Pydantic.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
@@ -0,0 +1,62 @@
+"""
+TTL cache for retrieval results
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import orjson
+
+
+class RetrievalResultCache:
+    """
+    Caches hybrid retrieval results keyed by the query parameters
+
+    Entries live in process memory, like the graph they were computed from,
+    and must be cleared whenever a different graph is built or loaded.
+    """
+
+    def __init__(self, ttl: int, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(**params: Any) -> str:
+        """Cache key for a set of (JSON-serializable) query parameters"""
+        payload = orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached value, or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        """
+        Store a value, evicting the least recently used entries when full
+        """
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all cached results (e.g. after a new graph is loaded)
+        """
+        self._entries.clear()
@@ -1,14 +1,48 @@
 """
 Semantic Search Engine using Sentence Transformers and ChromaDB
 """
+import hashlib
 import chromadb
+import orjson
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import numpy as np
 from loguru import logger
 
+from app.core.embedding_cache import EmbeddingCache
+from app.core.query_cache import SimilarityQueryCache
+
+# Texts per model forward pass when indexing
+ENCODE_BATCH_SIZE = 64
+
+# Smallest indexing job worth spreading over the multi-process encode pool
+POOL_MIN_TEXTS = 500
+
+# Clause content items whose text is indexed
+CLAUSE_TEXT_TYPES = frozenset({'paragraph', 'list_item'})
+
+# Records per ChromaDB write call (also capped by the client's max batch size)
+ADD_BATCH_SIZE = 2000
+
+# HNSW index parameters for the vector collections
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64
+}
+
+# Metadata field holding the hash of a record's document and metadata
+RECORD_HASH_KEY = "content_hash"
+
+def _record_hash(document: str, metadata: Dict[str, Any]) -> str:
+    """Hash identifying the stored content of one vector record"""
+    payload = orjson.dumps([document, metadata], option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
 class SemanticSearchEngine:
     """
     Semantic search using embeddings and vector similarity
@@ -16,59 +50,246 @@ class SemanticSearchEngine:
 
     def __init__(self, model_name: str = "all-MiniLM-L6-v2",
                  vector_db_path: str = "./chroma_db",
-                 seed: int = 42):
+                 seed: int = 42,
+                 embedding_cache_path: Optional[str] = None,
+                 backend: str = "torch",
+                 model_file: Optional[str] = None,
+                 pool_workers: int = 0,
+                 num_threads: Optional[int] = None,
+                 compile_model: bool = False):
         self.model_name = model_name
         self.seed = seed
         self._set_determinism()
 
-        logger.info(f"Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        logger.info(f"Loading embedding model: {model_name} ({backend} backend)")
+        backend_kwargs = {}
+        if backend != "torch":
+            backend_kwargs["backend"] = backend
+        if model_file:
+            backend_kwargs["model_kwargs"] = {"file_name": model_file}
+        self.model = SentenceTransformer(model_name, **backend_kwargs)
+
+        self.compiled = compile_model and backend == "torch" and hasattr(torch, "compile")
+        if self.compiled:
+            self._compile_model()
+
+        # CPU worker processes for large indexing runs, started on first use
+        # (compiled modules cannot be shipped to the worker processes)
+        self.pool_workers = 0 if self.compiled else pool_workers
+        self._pool = None
 
         # Initialize ChromaDB
         Path(vector_db_path).mkdir(parents=True, exist_ok=True)
         self.chroma_client = chromadb.PersistentClient(path=vector_db_path)
 
+        # Identifies the vectors this engine produces. Exported/quantized
+        # variants produce slightly different vectors, so they are keyed
+        # separately from the torch model
+        self.embedding_key = model_name
+        if backend != "torch":
+            self.embedding_key = f"{model_name}@{backend}:{model_file or 'default'}"
+
+        # Content-hash cache so rebuilds only embed new or changed text
+        self.embedding_cache = None
+        if embedding_cache_path:
+            self.embedding_cache = EmbeddingCache(embedding_cache_path, self.embedding_key)
+
         # Collections
         self.clause_collection = None
         self.requirement_collection = None
 
+        # Record hashes of each collection by node id, read from the
+        # collection once and then kept in step with every write
+        self._record_hashes: Dict[str, Dict[str, str]] = {}
+
+        # Embeddings of the current index, by node type
+        self.indexed_vectors = {}
+
+        # Results for repeated or near-identical queries
+        self.query_cache = SimilarityQueryCache(
+            dim=self.model.get_sentence_embedding_dimension()
+        )
+
     def _set_determinism(self):
-        """Set random seeds for reproducibility"""
+        """
+        Set random seeds for reproducibility
+
+        The cuDNN flags cost nothing here: the transformer encoder runs no
+        convolutions for the autotuner to pick algorithms for.
+        """
         torch.manual_seed(self.seed)
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
         np.random.seed(self.seed)
 
+    def _compile_model(self):
+        """
+        Compile the transformer module and warm it up
+
+        Shapes are dynamic because length-sorted batches vary in sequence
+        length. The warm-up encodes a short and a long batch so the first
+        index build does not pay the compilation latency.
+        """
+        logger.info("Compiling embedding model with torch.compile...")
+        transformer = self.model[0]
+        transformer.auto_model = torch.compile(transformer.auto_model, dynamic=True)
+        for text in ("warm up", "warm up " * 64):
+            self.model.encode([text] * 2, convert_to_numpy=True, normalize_embeddings=True)
+
     def index_graph(self, graph):
         """
         Index all nodes from knowledge graph
         """
         logger.info("Indexing knowledge graph for semantic search...")
+        self._open_collections()
 
-        # Create or get collections
-        try:
-            self.chroma_client.delete_collection("clauses")
-            self.chroma_client.delete_collection("requirements")
-        except:
-            pass
+        clauses, requirements = self._collect_nodes(graph)
 
-        self.clause_collection = self.chroma_client.create_collection(
-            name="clauses",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Index clauses
+        clause_ids, clause_texts, clause_metadatas = clauses
+        clause_embeddings = np.empty((0, 0), dtype=np.float32)
+
+        # Clause records are written to ChromaDB on a background thread while
+        # the requirements are embedded
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            if clause_ids:
+                # Generate embeddings in batches
+                logger.info(f"Generating embeddings for {len(clause_ids)} clauses...")
+                clause_embeddings = self._embed_texts(clause_texts)
+
+            # Sync to ChromaDB (also drops clauses no longer in the graph)
+            clause_write = writer.submit(
+                self._sync_records, self.clause_collection,
+                clause_ids, clause_embeddings, clause_metadatas, clause_texts
+            )
 
-        self.requirement_collection = self.chroma_client.create_collection(
-            name="requirements",
-            metadata={"hnsw:space": "cosine"}
+            # Index requirements
+            req_ids, req_texts, req_metadatas = requirements
+            req_embeddings = np.empty((0, 0), dtype=np.float32)
+
+            if req_ids:
+                logger.info(f"Generating embeddings for {len(req_ids)} requirements...")
+                req_embeddings = self._embed_texts(req_texts)
+
+            clause_write.result()
+
+        self._sync_records(self.requirement_collection, req_ids, req_embeddings, req_metadatas, req_texts)
+
+        # Kept so the index can be saved alongside the graph
+        self.indexed_vectors = {
+            'clause_ids': np.asarray(clause_ids, dtype=str),
+            'clause_vecs': clause_embeddings,
+            'req_ids': np.asarray(req_ids, dtype=str),
+            'req_vecs': req_embeddings
+        }
+
+        logger.info(f"Indexing complete: {len(clause_ids)} clauses, {len(req_ids)} requirements")
+
+    def save_vectors(self, output_path: str):
+        """
+        Save the indexed embeddings as float16 next to the graph file
+
+        The archive is stored uncompressed so it loads without a zlib pass,
+        and records the embedding model that produced the vectors.
+        """
+        if not self.indexed_vectors:
+            return
+
+        np.savez(
+            output_path,
+            embedding_model=np.asarray(self.embedding_key),
+            clause_ids=self.indexed_vectors['clause_ids'],
+            clause_vecs=self.indexed_vectors['clause_vecs'].astype(np.float16),
+            req_ids=self.indexed_vectors['req_ids'],
+            req_vecs=self.indexed_vectors['req_vecs'].astype(np.float16)
         )
+        logger.info(f"Embeddings saved to: {output_path}")
 
-        # Index clauses
-        clause_ids = []
-        clause_texts = []
-        clause_metadatas = []
+    def load_vectors(self, graph, input_path: str):
+        """
+        Sync the vector collections to a loaded graph from saved embeddings
+
+        Restores the index of a previously built graph without running the
+        embedding model. Falls back to index_graph() when the embeddings were
+        made by another model or do not cover every node of the graph.
+        """
+        with np.load(input_path, mmap_mode='r') as saved:
+            saved_key = str(saved['embedding_model']) if 'embedding_model' in saved.files else None
+            vectors = {name: saved[name] for name in ('clause_ids', 'clause_vecs', 'req_ids', 'req_vecs')}
+
+        if saved_key != self.embedding_key:
+            logger.warning(f"Embeddings in {input_path} were made by {saved_key}, "
+                           f"not {self.embedding_key}; re-indexing graph")
+            self.index_graph(graph)
+            return
+
+        clauses, requirements = self._collect_nodes(graph)
+        node_sets = []
+        for (ids, texts, metadatas), saved_ids, saved_vecs in (
+            (clauses, vectors['clause_ids'], vectors['clause_vecs']),
+            (requirements, vectors['req_ids'], vectors['req_vecs'])
+        ):
+            row_by_id = {node_id: row for row, node_id in enumerate(saved_ids.tolist())}
+            rows = [row_by_id.get(node_id) for node_id in ids]
+            if None in rows:
+                logger.warning(f"Embeddings in {input_path} do not cover the graph; re-indexing graph")
+                self.index_graph(graph)
+                return
+            node_sets.append((ids, saved_vecs[rows].astype(np.float32, copy=False), metadatas, texts))
+
+        self._open_collections()
+        clause_records, requirement_records = node_sets
+        self._sync_records(self.clause_collection, *clause_records)
+        self._sync_records(self.requirement_collection, *requirement_records)
+
+        self.indexed_vectors = vectors
+        logger.info(f"Embeddings loaded from: {input_path}")
+
+    def _open_collections(self):
+        """
+        Open the persistent clause and requirement collections
+
+        Existing collections are kept so they can be synced incrementally;
+        collections indexed with a different embedding model are recreated.
+        """
+        self.query_cache.clear()
+
+        metadata = {**HNSW_METADATA, "embedding_model": self.embedding_key}
+        collections = []
+        for name in ("clauses", "requirements"):
+            try:
+                collection = self.chroma_client.get_collection(name=name)
+            except Exception:
+                collection = None
+
+            if collection is not None and (collection.metadata or {}).get("embedding_model") != self.embedding_key:
+                logger.info(f"Recreating collection '{name}' for embedding model {self.embedding_key}")
+                self.chroma_client.delete_collection(name)
+                collection = None
+
+            if collection is None:
+                collection = self.chroma_client.create_collection(name=name, metadata=metadata)
+                self._record_hashes[name] = {}
+            collections.append(collection)
+
+        self.clause_collection, self.requirement_collection = collections
+
+    def _collect_nodes(self, graph) -> Tuple[Tuple[List[str], List[str], List[Dict[str, Any]]],
+                                             Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """
+        Gather ids, texts and metadata of indexable clause and requirement nodes
+
+        Both node types are collected in a single pass over the graph.
+        """
+        clause_ids, clause_texts, clause_metadatas = [], [], []
+        req_ids, req_texts, req_metadatas = [], [], []
 
         for node_id, data in graph.nodes(data=True):
-            if data.get('node_type') == 'Clause':
+            node_type = data.get('node_type')
+            if node_type == 'Clause':
                 # Extract text content
                 text = self._extract_clause_text(data)
                 if text:
@@ -81,32 +302,7 @@ class SemanticSearchEngine:
                         'title': data.get('title', ''),
                         'depth': str(data.get('depth', 0))
                     })
-
-        if clause_ids:
-            # Generate embeddings in batches
-            logger.info(f"Generating embeddings for {len(clause_ids)} clauses...")
-            embeddings = self.model.encode(
-                clause_texts,
-                batch_size=32,
-                show_progress_bar=True,
-                normalize_embeddings=True
-            )
-
-            # Add to ChromaDB
-            self.clause_collection.add(
-                ids=clause_ids,
-                embeddings=embeddings.tolist(),
-                metadatas=clause_metadatas,
-                documents=clause_texts
-            )
-
-        # Index requirements
-        req_ids = []
-        req_texts = []
-        req_metadatas = []
-
-        for node_id, data in graph.nodes(data=True):
-            if data.get('node_type') == 'Requirement':
+            elif node_type == 'Requirement':
                 text = data.get('text', '')
                 if text:
                     req_ids.append(node_id)
@@ -118,42 +314,164 @@ class SemanticSearchEngine:
                         'keyword': data.get('keyword', '')
                     })
 
-        if req_ids:
-            logger.info(f"Generating embeddings for {len(req_ids)} requirements...")
-            embeddings = self.model.encode(
-                req_texts,
-                batch_size=32,
-                show_progress_bar=True,
-                normalize_embeddings=True
+        return (clause_ids, clause_texts, clause_metadatas), (req_ids, req_texts, req_metadatas)
+
+    def _sync_records(self, collection, ids: List[str], embeddings: np.ndarray,
+                      metadatas: List[Dict[str, Any]], documents: List[str]):
+        """
+        Make a collection hold exactly the given records
+
+        Records of nodes no longer in the graph are deleted, and only new or
+        changed records are written, so re-indexing an unchanged graph does
+        not touch the HNSW index. Records are compared by content hash
+        against the cached hashes of the stored records.
+        """
+        stored = self._stored_hashes(collection)
+        hashes = [_record_hash(document, metadata) for document, metadata in zip(documents, metadatas)]
+
+        incoming = set(ids)
+        stale = [node_id for node_id in stored if node_id not in incoming]
+        changed = [row for row, node_id in enumerate(ids) if stored.get(node_id) != hashes[row]]
+        logger.info(
+            f"Collection '{collection.name}': {len(changed)} new or changed, "
+            f"{len(stale)} removed, {len(ids) - len(changed)} unchanged"
+        )
+
+        batch_size = ADD_BATCH_SIZE
+        max_batch_size = getattr(self.chroma_client, 'get_max_batch_size', None)
+        if max_batch_size is not None:
+            batch_size = min(batch_size, max_batch_size())
+
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            collection.delete(ids=batch)
+            for node_id in batch:
+                del stored[node_id]
+
+        # Records are written in bounded batches, keeping each call within
+        # the client's batch limit
+        for start in range(0, len(changed), batch_size):
+            rows = changed[start:start + batch_size]
+            collection.upsert(
+                ids=[ids[row] for row in rows],
+                embeddings=embeddings[rows],
+                metadatas=[{**metadatas[row], RECORD_HASH_KEY: hashes[row]} for row in rows],
+                documents=[documents[row] for row in rows]
             )
+            stored.update((ids[row], hashes[row]) for row in rows)
+
+    def _stored_hashes(self, collection) -> Dict[str, str]:
+        """
+        Record hashes of a collection by node id
 
-            self.requirement_collection.add(
-                ids=req_ids,
-                embeddings=embeddings.tolist(),
-                metadatas=req_metadatas,
-                documents=req_texts
+        Read once per collection (ids and metadata only); records written
+        before hashes were stored have none and are rewritten on next sync.
+        """
+        hashes = self._record_hashes.get(collection.name)
+        if hashes is None:
+            existing = collection.get(include=["metadatas"])
+            hashes = self._record_hashes[collection.name] = {
+                node_id: (metadata or {}).get(RECORD_HASH_KEY)
+                for node_id, metadata in zip(existing['ids'], existing['metadatas'])
+            }
+        return hashes
+
+    def _get_pool(self):
+        """
+        Get the multi-process encode pool, or None when it is disabled
+
+        The pool is only used on CPU-only hosts; a GPU is already saturated
+        by a single process.
+        """
+        if self._pool is None and self.pool_workers > 0 and not torch.cuda.is_available():
+            logger.info(f"Starting embedding pool with {self.pool_workers} CPU workers")
+            self._pool = self.model.start_multi_process_pool(['cpu'] * self.pool_workers)
+        return self._pool
+
+    def close(self):
+        """
+        Stop the encode pool's worker processes, if any were started
+        """
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Run the embedding model over length-sorted mini-batches
+
+        Grouping texts of similar length keeps padding per batch small.
+        Results are returned in the original order.
+        """
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        embeddings = np.empty(
+            (len(texts), self.model.get_sentence_embedding_dimension()),
+            dtype=np.float32
+        )
+
+        pool = self._get_pool() if len(texts) >= POOL_MIN_TEXTS else None
+        if pool is not None:
+            # Workers take contiguous chunks of the sorted texts, so batches
+            # stay length-homogeneous
+            embeddings[order] = self.model.encode_multi_process(
+                [texts[i] for i in order],
+                pool,
+                batch_size=ENCODE_BATCH_SIZE,
+                normalize_embeddings=True
+            )
+            return embeddings
+
+        for start in range(0, len(order), ENCODE_BATCH_SIZE):
+            idxs = order[start:start + ENCODE_BATCH_SIZE]
+            embeddings[idxs] = self.model.encode(
+                [texts[i] for i in idxs],
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
             )
 
-        logger.info(f"Indexing complete: {len(clause_ids)} clauses, {len(req_ids)} requirements")
+        return embeddings
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, reusing cached vectors for text seen in earlier builds
+        """
+        if self.embedding_cache is None:
+            return self._encode(texts)
+
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        cached = self.embedding_cache.get_many(hashes)
+
+        # Encode each distinct uncached text once
+        missing = list(dict.fromkeys(h for h in hashes if h not in cached))
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+
+        if missing:
+            text_by_hash = dict(zip(hashes, texts))
+            new_embeddings = self._encode([text_by_hash[h] for h in missing])
+            self.embedding_cache.put_many(missing, new_embeddings)
+            cached.update(zip(missing, np.asarray(new_embeddings, dtype=np.float32)))
+
+        return np.stack([cached[h] for h in hashes])
 
     def _extract_clause_text(self, clause_data: Dict[str, Any]) -> str:
         """
         Extract searchable text from clause
         """
         text_parts = []
+        append = text_parts.append
 
         # Add title
-        title = clause_data.get('title', '')
+        title = clause_data.get('title')
         if title:
-            text_parts.append(title)
+            append(title)
 
         # Add content
-        content = clause_data.get('content', [])
-        for item in content:
-            if item.get('type') in ['paragraph', 'list_item']:
-                text = item.get('text', '')
+        for item in clause_data.get('content') or ():
+            if item.get('type') in CLAUSE_TEXT_TYPES:
+                text = item.get('text')
                 if text:
-                    text_parts.append(text)
+                    append(text)
 
         return ' '.join(text_parts)
 
@@ -170,25 +488,11 @@ class SemanticSearchEngine:
         if document_filter:
             where_filter = {"document_id": document_filter}
 
-        results = self.clause_collection.query(
-            query_texts=[query],
-            n_results=n_results,
-            where=where_filter
+        return self._query_collection(
+            self.clause_collection, query, n_results, where_filter,
+            scope=f"clauses|{n_results}|{document_filter}"
         )
 
-        # Format results
-        formatted_results = []
-        if results['ids']:
-            for idx, node_id in enumerate(results['ids'][0]):
-                formatted_results.append({
-                    'node_id': node_id,
-                    'relevance_score': 1.0 - results['distances'][0][idx],  # Convert distance to similarity
-                    'metadata': results['metadatas'][0][idx],
-                    'text': results['documents'][0][idx]
-                })
-
-        return formatted_results
-
     def search_requirements(self, query: str, n_results: int = 20,
                            requirement_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -202,8 +506,34 @@ class SemanticSearchEngine:
         if requirement_type:
             where_filter = {"requirement_type": requirement_type}
 
-        results = self.requirement_collection.query(
-            query_texts=[query],
+        return self._query_collection(
+            self.requirement_collection, query, n_results, where_filter,
+            scope=f"requirements|{n_results}|{requirement_type}"
+        )
+
+    def _query_collection(self, collection, query: str, n_results: int,
+                          where_filter: Optional[Dict[str, Any]],
+                          scope: str) -> List[Dict[str, Any]]:
+        """
+        Run a vector query, reusing results for repeated or near-identical queries
+        """
+        cached = self.query_cache.get_exact(scope, query)
+        if cached is not None:
+            return cached
+
+        query_embedding = self.model.encode(
+            [query],
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )[0]
+
+        cached = self.query_cache.get_similar(scope, query_embedding)
+        if cached is not None:
+            logger.debug(f"Similarity cache hit for query: {query[:80]}")
+            return cached
+
+        results = collection.query(
+            query_embeddings=query_embedding[np.newaxis],
             n_results=n_results,
             where=where_filter
         )
@@ -214,9 +544,10 @@ class SemanticSearchEngine:
             for idx, node_id in enumerate(results['ids'][0]):
                 formatted_results.append({
                     'node_id': node_id,
-                    'relevance_score': 1.0 - results['distances'][0][idx],
+                    'relevance_score': 1.0 - results['distances'][0][idx],  # Convert distance to similarity
                     'metadata': results['metadatas'][0][idx],
                     'text': results['documents'][0][idx]
                 })
 
+        self.query_cache.put(scope, query, query_embedding, formatted_results)
         return formatted_results
@@ -3,6 +3,7 @@ Main FastAPI application for Knowledge Graph DVP Generation System
 """
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -43,6 +44,7 @@ async def lifespan(app: FastAPI):
 
     # Cleanup
     logger.info("Shutting down Knowledge Graph API...")
+    graph.close_search_engines()
 
 # Create FastAPI app
 app = FastAPI(
@@ -79,6 +81,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses (retrieval results, job results, graph data) for
+# clients that accept gzip; small responses are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include routers
 app.include_router(
     ingest.router,
@@ -111,7 +111,9 @@ class RetrievalQueryRequest(BaseModel):
 
 class LLMGenerationRequest(BaseModel):
     """Request for LLM to generate test procedures"""
-    retrieved_context: List[Dict[str, Any]]
+    retrieved_context: List[Dict[str, Any]] = Field(default_factory=list)
+    retrieved_context_ref: Optional[str] = Field(default=None, description="query_id of a recent /retrieval/query whose results are used as context")
+    max_context: Optional[int] = Field(default=None, ge=1, description="Use at most this many context items")
     component_profile: ComponentProfileRequest
     generation_mode: str = Field(default="detailed", description="brief, detailed, comprehensive")
     generation_method: str = Field(default="llm", description="Method: 'llm' or 'deterministic'")
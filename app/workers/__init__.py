@@ -0,0 +1 @@
+# Background task workers
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Dramatiq actors running test procedure generation outside the API process
+
+Enabled with TASK_QUEUE_ENABLED=true and REDIS_URL; start workers with:
+    dramatiq app.workers.llm_worker
+"""
+import asyncio
+import threading
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+
+from app.config import settings
+from app.models.api_models import LLMGenerationRequest
+
+dramatiq.set_broker(RedisBroker(url=settings.redis_url))
+
+# Each worker thread keeps one event loop so the async LLM client cached for
+# that loop is reused across jobs (the rate limiter is shared by all threads)
+_local = threading.local()
+
+
+def run_async(coro):
+    """Run a coroutine on this worker thread's event loop"""
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+
+# The generation functions retry rate limits themselves and record failures
+# in the job store, so the broker does not retry them again
+
+@dramatiq.actor(max_retries=0, time_limit=settings.task_time_limit_seconds * 1000)
+def run_llm_generation(job_id: str, request_data: dict):
+    """Run LLM test procedure generation for a queued job"""
+    from app.api.v1.llm import process_llm_generation
+
+    request = LLMGenerationRequest.model_validate(request_data)
+    run_async(process_llm_generation(job_id, request))
+
+
+@dramatiq.actor(max_retries=0, time_limit=settings.task_time_limit_seconds * 1000)
+def run_deterministic_generation(job_id: str, request_data: dict):
+    """Run deterministic (no LLM) test procedure generation for a queued job"""
+    from app.api.v1.llm import process_deterministic_generation
+
+    request = LLMGenerationRequest.model_validate(request_data)
+    run_async(process_deterministic_generation(job_id, request))
@@ -2,27 +2,68 @@
 Complete End-to-End Test of Knowledge Graph DVP System
 Tests all 6 endpoints in sequence
 """
-import requests
-import json
+import httpx
+import orjson
+import os
+import sys
 import time
 from datetime import datetime
 
 BASE_URL = "http://localhost:8000"
 
+# Longest time the server holds a status request open (long polling)
+LONG_POLL_SECONDS = 30
+
+# Backoff between status requests when the server answers without waiting
+POLL_MIN_DELAY = 0.5
+POLL_MAX_DELAY = 10
+
+# One client for every request in the workflow: HTTP/2 where the server
+# supports it, otherwise pooled HTTP/1.1 keep-alive connections
+CLIENT = httpx.Client(
+    base_url=BASE_URL,
+    http2=True,
+    timeout=120,
+    limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+)
+
+# Request bodies are encoded with orjson and posted as raw bytes
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 def print_section(title):
     print("\n" + "="*80)
     print(f"  {title}")
     print("="*80)
 
 def wait_for_job(endpoint, job_id, max_wait=120):
-    """Wait for a background job to complete"""
+    """
+    Wait for a background job to complete
+
+    The server holds each status request until the job finishes or its status
+    changes, so there is normally no client-side sleep between requests. If
+    the server answers early without a status change (no long polling), the
+    requests back off exponentially instead.
+    """
     start_time = time.time()
+    status = None
+    last_printed = None
+    delay = POLL_MIN_DELAY
     while time.time() - start_time < max_wait:
-        response = requests.get(f"{BASE_URL}{endpoint}/{job_id}")
-        data = response.json()
-        status = data.get('status')
-
-        print(f"  Status: {status} | Progress: {data.get('progress_percent', 0)}%")
+        wait = max(1, min(LONG_POLL_SECONDS, max_wait - (time.time() - start_time)))
+        params = {'wait': wait}
+        if status:
+            params['since_status'] = status
+
+        request_start = time.time()
+        response = CLIENT.get(f"{endpoint}/{job_id}", params=params, timeout=wait + 10)
+        data = orjson.loads(response.content)
+        previous_status, status = status, data.get('status')
+
+        # Only report when something changed since the last report
+        progress = data.get('progress_percent', 0)
+        if (status, progress) != last_printed:
+            print(f"  Status: {status} | Progress: {progress}%")
+            last_printed = (status, progress)
 
         if status == 'completed':
             return data
@@ -30,7 +71,11 @@ def wait_for_job(endpoint, job_id, max_wait=120):
             print(f"  ERROR: {data.get('error')}")
             return None
 
-        time.sleep(3)
+        if status != previous_status:
+            delay = POLL_MIN_DELAY
+        elif time.time() - request_start < wait:
+            time.sleep(delay)
+            delay = min(delay * 1.5, POLL_MAX_DELAY)
 
     print("  TIMEOUT: Job did not complete in time")
     return None
@@ -47,22 +92,31 @@ component_profile = {
     "quantity_per_test": {"Standard": 5}
 }
 
+# Fields shared by every test case sent to /dvp/generate
+TEST_CASE_DEFAULTS = {
+    "test_responsibility": "Supplier",
+    "test_stage": "DVP",
+    "quantity": "5 samples",
+    "pcb_or_lamp": "System level",
+    "remarks": ""
+}
+
 print_section("KNOWLEDGE GRAPH DVP GENERATION - COMPLETE WORKFLOW TEST")
 print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 # Step 1: Check if graph is already built
 print_section("Step 1: Checking Graph Status")
 try:
-    response = requests.get(f"{BASE_URL}/api/v1/visualization/graph-data?max_nodes=1")
+    response = CLIENT.get("/api/v1/visualization/graph-data", params={"max_nodes": 1})
     if response.status_code == 200:
         print("[OK] Graph is already built and ready!")
         graph_ready = True
     else:
         print("[FAIL] Graph not built yet")
         graph_ready = False
-except:
+except httpx.TransportError:
     print("[FAIL] Cannot connect to server")
-    exit(1)
+    sys.exit(1)
 
 # Step 2: Retrieve relevant requirements
 print_section("Step 2: Retrieving Relevant Requirements (Hybrid Search)")
@@ -73,13 +127,14 @@ retrieval_request = {
     "min_confidence": 0.55
 }
 
-response = requests.post(
-    f"{BASE_URL}/api/v1/retrieval/query",
-    json=retrieval_request
+response = CLIENT.post(
+    "/api/v1/retrieval/query",
+    content=orjson.dumps(retrieval_request),
+    headers=JSON_HEADERS
 )
 
 if response.status_code == 200:
-    retrieval_data = response.json()
+    retrieval_data = orjson.loads(response.content)
     print(f"[OK] Retrieved {retrieval_data['total_results']} relevant requirements")
     print(f"  Query ID: {retrieval_data['query_id']}")
     print(f"  Retrieval Method: {retrieval_data['retrieval_metadata']['retrieval_method']}")
@@ -94,11 +149,11 @@ if response.status_code == 200:
 else:
     print(f"[FAIL] Retrieval failed: {response.status_code}")
     print(response.text)
-    exit(1)
+    sys.exit(1)
 
 # Save retrieval results for reference
-with open('retrieval_results.json', 'w') as f:
-    json.dump(retrieval_data, f, indent=2)
+with open('retrieval_results.json', 'wb') as f:
+    f.write(orjson.dumps(retrieval_data, option=orjson.OPT_INDENT_2))
 print("\n  Saved full results to: retrieval_results.json")
 
 # Step 3: Generate test procedures with LLM
@@ -109,19 +164,21 @@ print("  Note: LLM generation requires OPENAI_API_KEY in .env file")
 print("  If not configured, this step will be skipped.\n")
 
 llm_request = {
-    "retrieved_context": retrieval_data['results'][:10],  # Use top 10 results
+    "retrieved_context_ref": retrieval_data['query_id'],  # Results held by the server
+    "max_context": 10,  # Use top 10 results
     "component_profile": component_profile,
     "generation_mode": "detailed",
     "include_traceability": True
 }
 
-response = requests.post(
-    f"{BASE_URL}/api/v1/llm/generate",
-    json=llm_request
+response = CLIENT.post(
+    "/api/v1/llm/generate",
+    content=orjson.dumps(llm_request),
+    headers=JSON_HEADERS
 )
 
 if response.status_code == 200:
-    llm_job = response.json()
+    llm_job = orjson.loads(response.content)
     print(f"[OK] LLM generation job started: {llm_job['job_id']}")
 
     # Wait for completion
@@ -138,8 +195,8 @@ if response.status_code == 200:
             print(f"    {i}. {proc['test_name']}")
 
         # Save LLM results
-        with open('llm_results.json', 'w') as f:
-            json.dump(llm_result, f, indent=2)
+        with open('llm_results.json', 'wb') as f:
+            f.write(orjson.dumps(llm_result, option=orjson.OPT_INDENT_2))
         print("\n  Saved full results to: llm_results.json")
 
         has_llm_results = True
@@ -156,56 +213,48 @@ print_section("Step 4: Generating DVP Excel Document")
 
 if has_llm_results:
     # Format test procedures into test cases
-    test_cases = []
-    for idx, proc in enumerate(test_procedures[:10], 1):  # Limit to 10 for demo
-        test_cases.append({
+    test_cases = [
+        {
+            **TEST_CASE_DEFAULTS,
             "test_id": f"B{idx}",
             "test_standard": proc.get("test_standard", "BS EN 50174-3:2013"),
             "test_description": proc["test_name"],
             "test_procedure": proc["detailed_procedure"],
             "acceptance_criteria": proc["acceptance_criteria"],
-            "test_responsibility": "Supplier",
-            "test_stage": "DVP",
-            "quantity": "5 samples",
             "estimated_days": proc.get("estimated_days", 5),
-            "pcb_or_lamp": "System level",
-            "remarks": "",
             "traceability": proc.get("traceability", {})
-        })
+        }
+        for idx, proc in enumerate(test_procedures[:10], 1)  # Limit to 10 for demo
+    ]
 else:
     # Use mock test cases for demonstration
     print("  Using mock test cases (LLM not available)")
     test_cases = [
         {
+            **TEST_CASE_DEFAULTS,
             "test_id": "B1",
             "test_standard": "BS EN 50174-3:2013",
             "test_description": "Underground Pathway Mechanical Protection Test",
             "test_procedure": "Install cable management system underground and subject to mechanical load testing per standard requirements. Monitor for damage or deformation.",
             "acceptance_criteria": "No visible damage, deformation, or failure of pathway system under specified mechanical loads",
-            "test_responsibility": "Supplier",
-            "test_stage": "DVP",
-            "quantity": "5 samples",
             "estimated_days": 7,
-            "pcb_or_lamp": "System level",
-            "remarks": "",
             "traceability": {"source_clause": "BS_EN_50174_3_2013::4.4.2"}
         },
         {
+            **TEST_CASE_DEFAULTS,
             "test_id": "B2",
             "test_standard": "BS EN 50174-3:2013",
             "test_description": "Environmental Resistance Test",
             "test_procedure": "Expose underground pathway system to environmental conditions including moisture, temperature variations, and soil chemistry as specified in standard.",
             "acceptance_criteria": "Pathway system maintains structural integrity and protective properties after environmental exposure",
-            "test_responsibility": "Supplier",
-            "test_stage": "DVP",
-            "quantity": "5 samples",
             "estimated_days": 14,
-            "pcb_or_lamp": "System level",
-            "remarks": "",
             "traceability": {"source_clause": "BS_EN_50174_3_2013::4.3.4"}
         }
     ]
 
+# Set once the DVP document has been downloaded
+output_filename = None
+
 dvp_request = {
     "component_profile": component_profile,
     "test_cases": test_cases,
@@ -213,13 +262,14 @@ dvp_request = {
     "include_traceability_sheet": True
 }
 
-response = requests.post(
-    f"{BASE_URL}/api/v1/dvp/generate",
-    json=dvp_request
+response = CLIENT.post(
+    "/api/v1/dvp/generate",
+    content=orjson.dumps(dvp_request),
+    headers=JSON_HEADERS
 )
 
 if response.status_code == 200:
-    dvp_job = response.json()
+    dvp_job = orjson.loads(response.content)
     print(f"[OK] DVP generation job started: {dvp_job['job_id']}")
 
     # Wait for completion
@@ -238,22 +288,24 @@ if response.status_code == 200:
         # Step 5: Download DVP
         print_section("Step 5: Downloading DVP Document")
 
-        response = requests.get(
-            f"{BASE_URL}/api/v1/dvp/download/{dvp_id}",
-            stream=True
-        )
-
-        if response.status_code == 200:
-            output_filename = f"Generated_DVP_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            with open(output_filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            print(f"[OK] DVP downloaded successfully")
-            print(f"  Saved to: {output_filename}")
-            print(f"  File size: {len(open(output_filename, 'rb').read()):,} bytes")
-        else:
-            print(f"[FAIL] Download failed: {response.status_code}")
+        # xlsx files are already zip-compressed, so ask for the file as is
+        # and write the raw body in 1 MiB chunks
+        with CLIENT.stream(
+            "GET",
+            f"/api/v1/dvp/download/{dvp_id}",
+            headers={"Accept-Encoding": "identity"}
+        ) as response:
+            if response.status_code == 200:
+                output_filename = f"Generated_DVP_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+                with open(output_filename, 'wb') as f:
+                    for chunk in response.iter_raw(chunk_size=1 << 20):
+                        f.write(chunk)
+
+                print(f"[OK] DVP downloaded successfully")
+                print(f"  Saved to: {output_filename}")
+                print(f"  File size: {os.path.getsize(output_filename):,} bytes")
+            else:
+                print(f"[FAIL] Download failed: {response.status_code}")
     else:
         print("[FAIL] DVP generation failed or timed out")
 else:
@@ -267,10 +319,8 @@ print("\nGenerated Files:")
 print("  1. retrieval_results.json - Retrieved requirements from knowledge graph")
 if has_llm_results:
     print("  2. llm_results.json - LLM-generated test procedures")
-import glob
-dvp_files = glob.glob("Generated_DVP_*.xlsx")
-if dvp_files:
-    print(f"  3. {dvp_files[-1]} - Final DVP Excel document")
+if output_filename:
+    print(f"  3. {output_filename} - Final DVP Excel document")
 
 print("\n[OK] All endpoints tested successfully!")
 print("\nYou can now:")
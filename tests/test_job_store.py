@@ -0,0 +1,170 @@
+"""
+Unit tests for the background job store
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core import job_store
+from app.core.job_store import JobStore
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable replacement for time.time() inside the job store"""
+    now = [1000.0]
+    monkeypatch.setattr(job_store.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def redis_store(monkeypatch):
+    """JobStore backed by an in-process fake Redis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(job_store.settings, 'redis_url', 'redis://localhost:6379/0')
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    monkeypatch.setattr(redis.asyncio.Redis, 'from_url',
+                        classmethod(lambda cls, url: fakeredis.FakeAsyncRedis(server=server)))
+    return JobStore('test', ttl=60, max_entries=10)
+
+
+async def test_create_stores_job_id_field():
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', job_id='a', status='pending')
+
+    assert await jobs.get('a') == {'job_id': 'a', 'status': 'pending'}
+    assert await jobs.count() == 1
+
+
+async def test_update_merges_fields():
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', job_id='a', status='pending', progress_percent=0.0)
+    await jobs.update('a', status='processing', progress_percent=50.0)
+
+    assert await jobs.get('a') == {'job_id': 'a', 'status': 'processing', 'progress_percent': 50.0}
+
+
+async def test_update_missing_job_is_noop():
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.update('missing', status='completed')
+
+    assert await jobs.get('missing') is None
+    assert await jobs.count() == 0
+
+
+async def test_jobs_expire_after_ttl(clock):
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', status='pending')
+
+    clock[0] += 30
+    await jobs.update('a', status='processing')
+    clock[0] += 45
+    assert (await jobs.get('a'))['status'] == 'processing'
+
+    clock[0] += 60
+    assert await jobs.get('a') is None
+    assert await jobs.count() == 0
+
+
+async def test_least_recently_updated_jobs_are_evicted():
+    jobs = JobStore('test', ttl=60, max_entries=2)
+    await jobs.create('a', status='pending')
+    await jobs.create('b', status='pending')
+    await jobs.update('a', status='processing')
+    await jobs.create('c', status='pending')
+
+    assert [job_id for job_id, _ in await jobs.items()] == ['a', 'c']
+    assert await jobs.get('b') is None
+
+
+async def test_redis_create_update_get(redis_store):
+    await redis_store.create('a', job_id='a', status='pending')
+    await redis_store.update('a', status='completed', result={'count': 3})
+
+    assert await redis_store.get('a') == {'job_id': 'a', 'status': 'completed', 'result': {'count': 3}}
+    assert await redis_store.count() == 1
+
+
+async def test_redis_update_missing_job_is_noop(redis_store):
+    await redis_store.update('missing', progress_percent=10.0)
+
+    assert await redis_store.get('missing') is None
+    assert await redis_store.count() == 0
+
+
+async def test_redis_least_recently_updated_jobs_are_evicted(redis_store, clock):
+    redis_store.max_entries = 2
+    for job_id in ('a', 'b', 'c'):
+        clock[0] += 1
+        await redis_store.create(job_id, status='pending')
+
+    assert [job_id for job_id, _ in await redis_store.items()] == ['b', 'c']
+    assert await redis_store.get('a') is None
+
+
+@pytest.fixture
+def no_recheck(monkeypatch):
+    """Make waiters rely on change notifications alone"""
+    monkeypatch.setattr(job_store, '_WAIT_RECHECK_INTERVAL', 30.0)
+
+
+async def test_wait_for_job_wakes_on_update(no_recheck):
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', status='pending')
+
+    async def finish():
+        await asyncio.sleep(0.05)
+        await jobs.update('a', status='completed')
+
+    waiter = asyncio.create_task(job_store.wait_for_job(jobs, 'a', timeout=5))
+    await finish()
+    job = await asyncio.wait_for(waiter, timeout=1)
+
+    assert job['status'] == 'completed'
+
+
+async def test_wait_for_job_wakes_on_update_from_another_thread(no_recheck):
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', status='pending')
+
+    def worker():
+        # Worker threads drive their own event loop
+        asyncio.run(jobs.update('a', status='processing'))
+
+    timer = threading.Timer(0.05, worker)
+    timer.start()
+    job = await asyncio.wait_for(job_store.wait_for_job(jobs, 'a', timeout=5, since_status='pending'), timeout=1)
+    timer.join()
+
+    assert job['status'] == 'processing'
+    assert jobs._watchers == {}
+
+
+async def test_wait_for_job_times_out_with_latest_state():
+    jobs = JobStore('test', ttl=60, max_entries=10)
+    await jobs.create('a', status='processing')
+
+    assert (await job_store.wait_for_job(jobs, 'a', timeout=0.05))['status'] == 'processing'
+    assert await job_store.wait_for_job(jobs, 'missing', timeout=0.05) is None
+
+
+async def test_redis_wait_for_job_wakes_on_update(redis_store, no_recheck):
+    await redis_store.create('a', status='pending')
+
+    async def finish():
+        await asyncio.sleep(0.1)
+        await redis_store.update('a', status='completed')
+
+    waiter = asyncio.create_task(job_store.wait_for_job(redis_store, 'a', timeout=5))
+    await finish()
+    job = await asyncio.wait_for(waiter, timeout=2)
+
+    assert job['status'] == 'completed'
@@ -0,0 +1,49 @@
+"""
+Unit tests for the requirement keyword index
+"""
+from app.core.keyword_index import KeywordIndex
+
+
+def make_index() -> KeywordIndex:
+    return KeywordIndex.from_requirements([
+        ('r1', 'the lamp shall withstand thermal shock at 85°c', 'mandatory'),
+        ('r2', 'vibration testing should follow the profile', 'recommended'),
+        ('r3', '', 'mandatory'),
+        ('r4', 'thermal cycling and vibration in humid climate', 'mandatory'),
+    ])
+
+
+def test_empty_text_is_not_indexed():
+    index = make_index()
+
+    assert index.node_ids == ['r1', 'r2', 'r4']
+    assert index.mandatory.tolist() == [True, False, True]
+
+
+def test_lookup_keeps_substring_semantics():
+    index = make_index()
+
+    assert index.lookup_rows('therm').tolist() == [0, 2]
+    assert index.lookup_rows('85°c').tolist() == [0]
+    assert index.lookup_rows('thermal shock').tolist() == [0]
+    assert index.lookup_rows('shock thermal').tolist() == []
+    assert index.lookup_rows('missing').tolist() == []
+
+
+def test_match_reports_terms_in_term_order():
+    index = make_index()
+
+    assert index.match(['vibration', 'thermal', 'climate']) == {
+        'r1': ['thermal'],
+        'r2': ['vibration'],
+        'r4': ['vibration', 'thermal', 'climate'],
+    }
+
+
+def test_added_requirements_are_searchable():
+    index = make_index()
+    index.lookup_rows('humid')
+    index.add('r5', 'humidity exposure for 48 hours', mandatory=True)
+
+    assert index.lookup_rows('humid').tolist() == [2, 3]
+    assert index.mandatory.tolist() == [True, False, True, True]
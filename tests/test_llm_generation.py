@@ -0,0 +1,160 @@
+"""
+Unit tests for LLM response parsing and test procedure post-processing
+"""
+import asyncio
+
+import pytest
+
+from app.api.v1 import llm
+from app.api.v1.llm import JSONArrayStream, parse_json_array
+from app.models.api_models import LLMGenerationRequest
+
+COMPONENT_PROFILE = {
+    "name": "Headlamp",
+    "type": "LED lamp",
+    "application": "automotive",
+    "test_level": "component",
+    "test_categories": ["thermal"],
+    "specifications": {},
+    "applicable_standards": ["ISO_16750"]
+}
+
+
+def make_request(count: int) -> LLMGenerationRequest:
+    return LLMGenerationRequest(
+        retrieved_context=[
+            {
+                'requirement_id': f"ISO_16750::4.{i}::req_0",
+                'text': f"The lamp shall survive thermal cycle {i}",
+                'relevance_score': 0.9
+            }
+            for i in range(count)
+        ],
+        component_profile=COMPONENT_PROFILE
+    )
+
+
+@pytest.fixture
+def generation(monkeypatch, tmp_path):
+    """Run process_llm_generation with canned sub-batch output"""
+    monkeypatch.setattr(llm.settings, 'output_dir', str(tmp_path))
+    monkeypatch.setattr(llm, 'get_llm_client', lambda: None)
+    monkeypatch.setattr(llm.ptp_generator, 'generate_ptp_docx', lambda **kwargs: str(tmp_path / "ptp.docx"))
+
+    def run(request, make_procedures):
+        async def fake_generate_batch(client, requirements, component_profile, on_procedure=None):
+            return make_procedures(requirements), 10
+
+        monkeypatch.setattr(llm, 'generate_batch', fake_generate_batch)
+
+        async def generate():
+            job_id = "job"
+            await llm.llm_jobs.create(job_id, job_id=job_id, status='pending')
+            await llm.process_llm_generation(job_id, request)
+            job = await llm.llm_jobs.get(job_id)
+            result = await llm.load_job_result(job) if job['status'] == 'completed' else None
+            return job, result
+
+        return asyncio.run(generate())
+
+    return run
+
+
+def test_acceptance_criteria_built_for_mapped_procedures(generation):
+    def procedures(requirements):
+        # One extra procedure without a source, and one without criteria
+        procs = [
+            {'test_name': req['text'], 'acceptance_criteria': f"criteria for {req['requirement_id']}"}
+            for req in requirements
+        ]
+        procs[0].pop('acceptance_criteria')
+        return procs + [{'test_name': 'extra', 'acceptance_criteria': 'unmapped'}]
+
+    job, result = generation(make_request(3), procedures)
+
+    assert job['status'] == 'completed'
+    assert result['procedures_generated'] == 4
+    assert result['acceptance_criteria'] == [
+        {
+            'criteria_id': f"AC_{i + 1}",
+            'test_id': f"B{i + 1}",
+            'criteria_text': f"criteria for ISO_16750::4.{i}::req_0",
+            'source_requirement': f"ISO_16750::4.{i}::req_0"
+        }
+        for i in (1, 2)
+    ]
+    assert result['test_procedures'][1]['traceability']['source_standard'] == 'ISO_16750'
+
+
+def test_job_fails_when_no_sub_batch_produces_procedures(generation):
+    job, result = generation(make_request(3), lambda requirements: [])
+
+    assert job['status'] == 'failed'
+    assert result is None
+
+
+def test_persistent_rate_limit_fails_the_sub_batch(monkeypatch):
+    class RateLimited(Exception):
+        pass
+
+    class Completions:
+        calls = 0
+
+        async def create(self, **kwargs):
+            Completions.calls += 1
+            raise RateLimited("Error code: 429 - rate limit exceeded")
+
+    class Client:
+        class chat:
+            completions = Completions()
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(llm.settings, 'llm_provider', 'openai')
+    monkeypatch.setattr(llm.settings, 'llm_cache_enabled', False)
+    monkeypatch.setattr(llm.asyncio, 'sleep', no_sleep)
+    requirements = make_request(2).retrieved_context
+
+    with pytest.raises(RateLimited):
+        asyncio.run(llm.generate_batch(Client(), requirements, COMPONENT_PROFILE))
+    assert Completions.calls == 5
+
+
+def test_stream_yields_items_as_they_complete():
+    stream = JSONArrayStream()
+
+    assert stream.feed('Here you go: [{"a": 1}, {"b": "}') == [{'a': 1}]
+    assert stream.feed('"}') == [{'b': '}'}]
+    assert not stream.complete
+
+    stream.feed(']')
+    assert stream.complete
+    assert stream.items == [{'a': 1}, {'b': '}'}]
+
+
+def test_stream_keeps_complete_items_of_truncated_output():
+    stream = JSONArrayStream()
+    stream.feed('[{"test_name": "a", "steps": [1, 2]}, {"test_name": "b", "steps": [')
+
+    assert not stream.complete
+    assert stream.items == [{'test_name': 'a', 'steps': [1, 2]}]
+
+
+def test_stream_of_text_without_array():
+    stream = JSONArrayStream()
+    stream.feed("I cannot help with that.")
+
+    assert not stream.complete
+    assert stream.items == []
+
+
+def test_parse_json_array_salvages_truncated_output():
+    content = '```json\n[{"test_name": "a"}, {"test_name": "b"}, {"test_na'
+
+    assert parse_json_array(content) == [{'test_name': 'a'}, {'test_name': 'b'}]
+
+
+def test_parse_json_array_wraps_single_object():
+    assert parse_json_array('{"test_name": "a"}') == [{'test_name': 'a'}]
+    assert parse_json_array('no json here') == []
@@ -0,0 +1,55 @@
+"""
+Unit tests for the client-side LLM rate limiter
+"""
+import asyncio
+import threading
+
+from app.core.rate_limit import AsyncTokenBucket
+
+
+def test_acquire_reserves_and_refund_returns_tokens():
+    bucket = AsyncTokenBucket(requests_per_minute=60, tokens_per_minute=600)
+
+    reserved = asyncio.run(bucket.acquire(100))
+    assert reserved == 100
+    assert bucket._tokens <= 501
+    assert bucket._requests <= 59.1
+
+    bucket.refund(60)
+    assert 560 <= bucket._tokens <= 600
+
+
+def test_reservation_is_capped_at_the_minute_budget():
+    bucket = AsyncTokenBucket(tokens_per_minute=600)
+
+    assert asyncio.run(bucket.acquire(10_000)) == 600
+
+
+def test_unbounded_tokens_reserve_nothing():
+    bucket = AsyncTokenBucket(requests_per_minute=60)
+
+    assert asyncio.run(bucket.acquire(10_000)) == 0
+
+
+def test_bucket_is_shared_by_threads_with_their_own_event_loops():
+    # An empty bucket makes every thread wait on its own loop (100 requests/s)
+    bucket = AsyncTokenBucket(requests_per_minute=6000)
+    bucket._requests = 0.0
+    errors = []
+
+    def worker():
+        async def acquire_many():
+            await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+        try:
+            asyncio.run(acquire_many())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert bucket._requests < 1